@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+Measure how ctracker scales, over synthetic repos of increasing size (see
+synthrepo.py). Every metric of metrics.metric_registry is run on its own with
+the 'query' engine, and all of them together with the 'scan' engine, each in
+a fresh process. The wall time, the number of git invocations and the peak
+memory of each run are saved to a JSON baseline, and compared against the
+previous one if given.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthrepo
+
+SIZES = [10000, 100000, 1000000]
+
+# Slowdowns below this are noise rather than regressions
+MIN_SLOWDOWN_SECS = 0.1
+
+
+def measure(repo, config, metrics, engine, since):
+    """Run in the child process: gather the metrics, and report the costs"""
+    from src import iomanager
+    from src import metrics as metrics_module
+
+    git_calls = 0
+    run, stream = iomanager.run, iomanager.stream
+
+    def counted(fn):
+        def wrapper(*args, **kwargs):
+            nonlocal git_calls
+            git_calls += 1
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    iomanager.run, iomanager.stream = counted(run), counted(stream)
+    args = iomanager.parse_args(
+        ["--repo", repo, "--config", config, "--engine", engine, "--since", since]
+        + ["--metrics"]
+        + metrics
+    )
+    start = time.monotonic()
+    metrics_module.gather_stats(args)
+    wall = time.monotonic() - start
+    return {
+        "wall_secs": round(wall, 3),
+        "git_calls": git_calls,
+        # Both in KiB on Linux
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "git_peak_rss_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+
+
+def run_child(repo, config, metrics, engine, since):
+    cmd = [sys.executable, __file__, "--child", repo, config, engine, since]
+    out = subprocess.run(
+        cmd + metrics,
+        check=True,
+        text=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def runs(metric_names):
+    for metric in metric_names:
+        yield f"query:{metric}", [metric], "query"
+    yield "scan:all", list(metric_names), "scan"
+
+
+def compare(baseline, results, tolerance):
+    """The runs that got slower, or ran more git commands, than in the baseline"""
+    regressions = []
+    for size, by_run in results.items():
+        for name, now in by_run.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if before is None:
+                continue
+            if now["git_calls"] > before["git_calls"]:
+                regressions.append(
+                    f"{name} @ {size}: {before['git_calls']} -> "
+                    + f"{now['git_calls']} git calls"
+                )
+            slowdown = now["wall_secs"] - before["wall_secs"]
+            if (
+                slowdown > before["wall_secs"] * tolerance
+                and slowdown > MIN_SLOWDOWN_SECS
+            ):
+                regressions.append(
+                    f"{name} @ {size}: {before['wall_secs']}s -> {now['wall_secs']}s"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "-n",
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=SIZES,
+        help=f"Number of commits of each repo. Default to {SIZES}",
+    )
+    parser.add_argument(
+        "-w",
+        "--work-dir",
+        default=os.path.join(ROOT, "benchmarks", "repos"),
+        help="Where to keep the generated repos.",
+    )
+    parser.add_argument(
+        "-o", "--output", default="baseline.json", help="Where to save the results"
+    )
+    parser.add_argument(
+        "-c", "--compare", metavar="JSON", help="Previous results to compare with"
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Slowdown ratio reported as a regression by --compare. Default to 0.2",
+    )
+    parser.add_argument(
+        "-m", "--metrics", nargs="+", metavar="METRIC", help="Limit to these metrics"
+    )
+    synthrepo.add_params_args(parser)
+    args = parser.parse_args()
+
+    from src import metrics
+
+    metric_names = args.metrics or list(metrics.metric_registry)
+    os.makedirs(args.work_dir, exist_ok=True)
+    results = {}
+    for size in args.sizes:
+        params = synthrepo.params_from_args(args, size)
+        print(f"======= {size} commits")
+        repo, config = synthrepo.get_repo(args.work_dir, params)
+        since = str(params["years"] + 1)
+        results[str(size)] = {}
+        for name, selected, engine in runs(metric_names):
+            result = run_child(repo, config, selected, engine, since)
+            results[str(size)][name] = result
+            print(
+                f"{name:40} {result['wall_secs']:9.3f}s "
+                + f"{result['git_calls']:5} git calls "
+                + f"{result['peak_rss_kib'] // 1024:6} MiB"
+            )
+
+    report = {
+        "date": str(datetime.date.today()),
+        "params": {
+            k: v
+            for k, v in synthrepo.params_from_args(args, None).items()
+            if k != "commits"
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"saved '{args.output}'")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        repo, config, engine, since, *selected = sys.argv[2:]
+        print(json.dumps(measure(repo, config, selected, engine, since)))
+    else:
+        main()
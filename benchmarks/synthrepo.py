@@ -0,0 +1,174 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+Generate synthetic git repos for the benchmarks, with `git fast-import`, and
+the ctracker config to analyze them.
+
+Commits are spread evenly over the last `years`. Each one is authored from an
+org domain (or an unrelated one) following the given email mix, touches one
+file, which belongs to the org files of the author's org with the given rate,
+and carries review and report trailers from a random org with the given
+rates. The same parameters and seed always give the same repo.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import yaml
+
+DAY = 24 * 60 * 60
+
+DEFAULTS = dict(
+    commits=10000,
+    orgs={"acme": 0.3, "globex": 0.15, "initech": 0.05},
+    other_domains=5,
+    org_file_rate=0.3,
+    review_rate=0.4,
+    report_rate=0.05,
+    dirs=200,
+    years=10,
+    seed=0,
+)
+
+
+def params_key(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def fast_import_stream(params, now):
+    rng = random.Random(params["seed"])
+    orgs = list(params["orgs"])
+    weights = list(params["orgs"].values())
+    others = [f"other{i}" for i in range(params["other_domains"])]
+    weights.append(max(0.0, 1.0 - sum(weights)))
+    authors = orgs + [None]
+    start = now - params["years"] * 365 * DAY
+    step = params["years"] * 365 * DAY / params["commits"]
+
+    for i in range(params["commits"]):
+        org = rng.choices(authors, weights)[0]
+        domain = f"{org}.com" if org else f"{rng.choice(others)}.org"
+        email = f"dev{rng.randrange(1000)}@{domain}"
+        timestamp = int(start + i * step) + 1
+
+        if org and rng.random() < params["org_file_rate"]:
+            path = f"drivers/{org}/dir{rng.randrange(params['dirs'])}/file.c"
+        else:
+            path = f"core/dir{rng.randrange(params['dirs'])}/file.c"
+
+        message = [f"change {i}", ""]
+        if rng.random() < params["review_rate"]:
+            reviewer = rng.choice(orgs + others)
+            domain = f"{reviewer}.com" if reviewer in orgs else f"{reviewer}.org"
+            message.append(f"Reviewed-by: Reviewer <rev@{domain}>")
+        if rng.random() < params["report_rate"]:
+            message.append(f"Reported-by: Reporter <rep@{rng.choice(orgs)}.com>")
+        message.append(f"Signed-off-by: Dev <{email}>")
+        message = "\n".join(message).encode() + b"\n"
+        content = f"{i}\n".encode()
+
+        yield b"commit refs/heads/master\n"
+        yield f"mark :{i + 1}\n".encode()
+        yield f"author Dev <{email}> {timestamp} +0000\n".encode()
+        yield f"committer Dev <{email}> {timestamp} +0000\n".encode()
+        yield f"data {len(message)}\n".encode() + message
+        if i > 0:
+            yield f"from :{i}\n".encode()
+        yield f"M 100644 inline {path}\n".encode()
+        yield f"data {len(content)}\n".encode() + content + b"\n"
+
+
+def config(params):
+    return {
+        "org_files": {org: f"drivers/{org}/" for org in params["orgs"]},
+        "org_domains": {org: org for org in params["orgs"]},
+    }
+
+
+def generate(path, params, now=None):
+    """Create the repo at `path`, and its config.yaml next to it"""
+    if now is None:
+        now = int(time.time())
+    subprocess.run(
+        ["git", "init", "-q", "--bare", "--initial-branch=master", path], check=True
+    )
+    proc = subprocess.Popen(
+        ["git", "-C", path, "fast-import", "--quiet"], stdin=subprocess.PIPE
+    )
+    batch = []
+    for chunk in fast_import_stream(params, now):
+        batch.append(chunk)
+        if len(batch) >= 4096:
+            proc.stdin.write(b"".join(batch))
+            batch = []
+    proc.stdin.write(b"".join(batch))
+    proc.stdin.close()
+    if proc.wait() != 0:
+        sys.exit(f"git fast-import failed for '{path}'")
+    subprocess.run(["git", "-C", path, "gc", "-q"], check=True)
+    with open(f"{path}.yaml", "w") as f:
+        yaml.dump(config(params), f)
+
+
+def get_repo(work_dir, params):
+    """
+    The path of a repo generated with these parameters, and of its config.
+    Repos are kept in `work_dir`, and only generated once.
+    """
+    path = os.path.join(work_dir, f"repo-{params['commits']}-{params_key(params)[:12]}")
+    if not os.path.exists(f"{path}.yaml"):
+        if os.path.exists(path):
+            subprocess.run(["rm", "-rf", path], check=True)
+        generate(path, params)
+    return path, f"{path}.yaml"
+
+
+def parse_orgs(value):
+    orgs = {}
+    for item in value.split(","):
+        org, rate = item.split("=")
+        orgs[org] = float(rate)
+    return orgs
+
+
+def add_params_args(parser):
+    parser.add_argument(
+        "--orgs",
+        type=parse_orgs,
+        default=DEFAULTS["orgs"],
+        help="Share of the commits authored by each org, as 'org=rate,...'. "
+        + "The rest come from unrelated domains. Default to "
+        + ",".join(f"{org}={rate}" for org, rate in DEFAULTS["orgs"].items()),
+    )
+    for name in ("org_file_rate", "review_rate", "report_rate"):
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=float,
+            default=DEFAULTS[name],
+            help=f"Default to {DEFAULTS[name]}",
+        )
+    parser.add_argument("--seed", type=int, default=DEFAULTS["seed"])
+
+
+def params_from_args(args, commits):
+    params = dict(DEFAULTS, commits=commits, orgs=args.orgs, seed=args.seed)
+    for name in ("org_file_rate", "review_rate", "report_rate"):
+        params[name] = getattr(args, name)
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic repo")
+    parser.add_argument("path", help="Where to create the (bare) repo")
+    parser.add_argument("-n", "--commits", type=int, default=DEFAULTS["commits"])
+    add_params_args(parser)
+    args = parser.parse_args()
+    generate(args.path, params_from_args(args, args.commits))
@@ -0,0 +1,76 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+Run analyses from Python rather than from the command line:
+
+    from src.api import analyze
+
+    results = analyze("path/to/repo", "main", "config.yaml", since=5, jobs=4)
+    results.column("total_patches")
+
+Each analysis runs with its own context.Context, so that several can run at
+once from threads of the same process.
+"""
+
+from . import iomanager, metrics, topn
+from . import context as contexts
+from .results import Results
+
+# Options about files to be read or written rather than analyses
+UNSUPPORTED_OPTIONS = (
+    "format",
+    "compress",
+    "dir",
+    "update",
+    "from_json",
+    "manifest",
+    "profile",
+    "cprofile",
+)
+
+
+def options_argv(options):
+    """The command line of keyword `options`, named like the args"""
+    argv = []
+    for name, value in options.items():
+        if name in UNSUPPORTED_OPTIONS:
+            raise TypeError(f"analyze() does not support the '{name}' option")
+        flag = "--" + name.replace("_", "-")
+        if value is None or value is False:
+            continue
+        if value is True:
+            argv.append(flag)
+        elif isinstance(value, (list, tuple)):
+            argv += [flag] + [str(v) for v in value]
+        else:
+            argv += [flag, str(value)]
+    return argv
+
+
+def analyze(repo, branch="HEAD", config=None, context=None, **options):
+    """
+    Analyze `branch` in the git repo at `repo`, and return the Results.
+
+    `config` is a config file name, or the parsed config. `options` are
+    those of the command line: since=5, orgs=["xyz"], engine="scan", top=10...
+
+    A new context is used unless one is given. Reusing a context keeps its
+    git processes and the memo of its git queries for later analyses, but a
+    context only runs one analysis at a time. Errors are raised as
+    ValueError.
+    """
+    ctx = contexts.Context() if context is None else context
+    argv = ["--repo", str(repo), "--branch", branch] + options_argv(options)
+    try:
+        with contexts.activate(ctx):
+            args = iomanager.parse_args(argv, config)
+            counts, headers = metrics.gather_stats(args)
+            return Results.from_args(args, counts, headers, topn.gather(args))
+    except SystemExit as e:
+        raise ValueError(e.code) from None
+    finally:
+        if context is None:
+            ctx.close()
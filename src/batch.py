@@ -0,0 +1,138 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import copy
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from . import iomanager, metrics, profiler, topn
+from .results import Results
+
+
+def load_manifest(filename):
+    """
+    The repos listed in a manifest, as (name, path, branch) tuples. Relative
+    paths are taken from the manifest's directory.
+    """
+    import yaml
+
+    with open(filename) as f:
+        data = yaml.safe_load(f)
+    if not isinstance(data, dict) or not data.get("repos"):
+        sys.exit(f"--manifest: no repos listed in '{filename}'")
+    base = os.path.dirname(os.path.abspath(filename))
+    repos = []
+    for entry in data["repos"]:
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        path = os.path.normpath(os.path.join(base, entry["path"]))
+        name = entry.get("name", os.path.basename(path))
+        repos.append((name, path, entry.get("branch")))
+    names = [name for name, _, _ in repos]
+    if len(set(names)) != len(names):
+        sys.exit("--manifest: repos must have unique names, use 'name:'")
+    return repos
+
+
+def init_worker(config):
+    # The parent reports the progress of the whole batch instead
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    iomanager.restore_config(config)
+    profiler.ACTIVE = None
+
+
+def analyze(args, name, path, branch):
+    args = copy.copy(args)
+    if branch is not None:
+        args.branch = branch
+        args.branches = [branch]
+    iomanager.select_repo(args, path)
+    args.repo = name
+    counts, headers = metrics.gather_stats(args)
+    return Results.from_args(args, counts, headers, topn.gather(args))
+
+
+def summarize(results):
+    """The totals of each metric by org, across all repos and by repo"""
+    orgs = results[0].orgs
+    return {
+        "metrics": results[0].metrics,
+        "orgs": orgs,
+        "repos": [r.repo for r in results],
+        "total": {
+            metric: dict(
+                zip(orgs, sum(r.column(metric).sum(0) for r in results).tolist())
+            )
+            for metric in results[0].metrics
+        },
+        "by_repo": {
+            r.repo: {
+                metric: dict(zip(orgs, r.column(metric).sum(0).tolist()))
+                for metric in r.metrics
+            }
+            for r in results
+        },
+    }
+
+
+def output_summary(args, summary):
+    if args.format == "cli":
+        from tabulate import tabulate
+
+        print("========= SUMMARY")
+        print(
+            tabulate(
+                [
+                    [summary["total"][metric][org] for metric in summary["metrics"]]
+                    for org in summary["orgs"]
+                ],
+                headers=summary["metrics"],
+                showindex=summary["orgs"],
+                tablefmt="simple",
+            )
+        )
+        return
+    os.makedirs(args.dir, exist_ok=True)
+    with open(f"{args.dir}/summary.json", "w") as f:
+        json.dump(summary, f, indent=4)
+
+
+def run(args):
+    """
+    Analyze every repo of the manifest. Repos are analyzed concurrently by up
+    to --jobs worker processes, set up once with the parsed config. Any jobs
+    left once every repo has a worker are used for the shards of each repo,
+    or for the per-org queries.
+    """
+    repos = load_manifest(args.manifest)
+    workers = max(1, min(args.jobs, len(repos)))
+    args.jobs = max(1, args.jobs // workers)
+    # The shards of a repo share its jobs, so that at most --jobs processes
+    # gather stats at once
+    args.shards = min(args.shards, args.jobs)
+    if workers == 1:
+        analyzed = [analyze(args, *repo) for repo in repos]
+    else:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker,
+            initargs=(iomanager.config_state(),),
+        )
+        with pool:
+            pending = [pool.submit(analyze, args, *repo) for repo in repos]
+            bar = iomanager.bar("Analyzing repos", len(pending))
+            for future in pending:
+                future.result()
+                bar.next()
+            bar.finish()
+        analyzed = [future.result() for future in pending]
+    for results in analyzed:
+        if args.format == "cli":
+            print(f"========= REPO {results.repo}")
+        iomanager.output_results(args, results)
+    output_summary(args, summarize(analyzed))
+    return analyzed
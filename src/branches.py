@@ -0,0 +1,50 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+Analyze several branches of a repo at once, with `--branch a b c`. Their
+history is walked once, see metrics.scan_branches(), so that the cost is that
+of their distinct commits rather than of each branch in turn, and each branch
+gets its own results, named `<repo>@<branch>`.
+"""
+
+import copy
+
+from . import iomanager, metrics
+from .results import Results
+
+
+def results_name(repo, branch):
+    # Also used as a file name
+    return f"{repo}@{branch}".replace("/", "_")
+
+
+def branch_args(args, branch_id):
+    """The args of an analysis of the branch_id-th branch only"""
+    args = copy.copy(args)
+    args.branch = args.branches[branch_id]
+    args.branches = [args.branch]
+    args.head = args.heads[branch_id]
+    args.heads = [args.head]
+    args.repo = results_name(args.repo, args.branch)
+    return args
+
+
+def analyze(args):
+    """The Results of each of args.branches"""
+    counts, headers = metrics.gather_branches(args)
+    return [
+        Results.from_args(branch_args(args, branch_id), branch_counts, headers)
+        for branch_id, branch_counts in enumerate(counts)
+    ]
+
+
+def run(args):
+    analyzed = analyze(args)
+    for results in analyzed:
+        if args.format == "cli":
+            print(f"========= BRANCH {results.repo}")
+        iomanager.output_results(args, results)
+    return analyzed
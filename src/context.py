@@ -0,0 +1,153 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+The state an analysis runs with, besides its args: the parsed config and the
+matchers built from it, the repo and branch being analyzed, how git is run,
+and the memo of the git queries already answered.
+
+Each thread runs with its current context: the one it was given by
+activate() or bind(), or else the default context of the process, which the
+command line uses. Several analyses can then run at once from threads of the
+same process, each with its own context.
+"""
+
+import collections
+import contextlib
+import threading
+from concurrent.futures import Future
+
+from . import gitbackend
+
+GIT_ENV = {
+    "HOME": "",
+    "XDG_CONFIG_HOME": "",
+    "GIT_CONFIG_NOGLOBAL": "1",
+}
+
+# What is not passed along to other processes, see Context.__getstate__()
+LOCAL_STATE = ("git", "pool", "memo", "trailer_matchers")
+
+
+class Memo:
+    """
+    The Futures of the git queries queued so far, by what their results
+    depend on. Only the `maxsize` most recently used are kept.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.futures = collections.OrderedDict()
+
+    def get(self, key, submit):
+        """The Future of `key`, queued with submit() if not known yet"""
+        with self.lock:
+            if key in self.futures:
+                self.futures.move_to_end(key)
+                return self.futures[key]
+            future = self.futures[key] = submit()
+            if len(self.futures) > self.maxsize:
+                self.futures.popitem(last=False)
+            return future
+
+    def clear(self):
+        with self.lock:
+            self.futures.clear()
+
+    def __len__(self):
+        return len(self.futures)
+
+
+class Context:
+    MEMO_SIZE = 4096
+
+    def __init__(self):
+        self.repo_path = ""
+        self.branch = ""
+        self.verbose = False
+        self.org_files = {}
+        self.org_file_globs = {}
+        self.org_domains = {}
+        self.domain_resolver = None
+        self.members = {}
+        self.identity_index = None
+        # The compiled trailer regexes of the identities, see
+        # metrics.trailer_matchers()
+        self.trailer_matchers = {}
+        self.path_index = None
+        self.git_env = dict(GIT_ENV)
+        self.git_backend = gitbackend.DEFAULT_BACKEND
+        self.git = None  # The git_backend instance, see iomanager.git_backend()
+        # Worker pool for the per-org git queries, only set while
+        # metrics.gather_stats() runs with --jobs > 1
+        self.pool = None
+        self.memo = Memo(self.MEMO_SIZE)
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in LOCAL_STATE}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
+    def detached(self):
+        """
+        A copy of the context for other processes, without the git processes,
+        workers and memo of this one
+        """
+        context = Context()
+        context.__dict__.update(self.__getstate__())
+        return context
+
+    def close(self):
+        if self.git is not None:
+            self.git.close()
+            self.git = None
+
+
+DEFAULT = Context()
+local = threading.local()
+
+
+def current():
+    return getattr(local, "context", DEFAULT)
+
+
+def set_default(context):
+    """Make `context` the one of every thread without its own"""
+    global DEFAULT
+    DEFAULT = context
+
+
+@contextlib.contextmanager
+def activate(context):
+    """Run the `with` block of the current thread with `context`"""
+    previous = getattr(local, "context", None)
+    local.context = context
+    try:
+        yield context
+    finally:
+        if previous is None:
+            del local.context
+        else:
+            local.context = previous
+
+
+def bind(func):
+    """Wrap `func` to run with the current context, from any thread"""
+    context = current()
+
+    def wrapper(*args, **kwargs):
+        with activate(context):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
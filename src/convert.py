@@ -0,0 +1,39 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+`ctracker convert`: convert a results file between the json and columnar
+formats, see json_parser.
+"""
+
+import argparse
+import sys
+
+from . import json_parser
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="ctracker convert",
+        description="Convert a results file, json or columnar, to the format "
+        + f"of the output: columnar if it ends with '{json_parser.COLUMNAR_EXTENSION}'"
+        + ", json otherwise.",
+    )
+    parser.add_argument("input", metavar="FILE", help="Results to convert")
+    parser.add_argument("output", metavar="OUTPUT", help="Where to save them")
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Compress the output, if columnar.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    try:
+        json_parser.convert(args.input, args.output, args.compress)
+    except (OSError, ValueError) as e:
+        sys.exit(f"ctracker convert: {e}")
@@ -0,0 +1,99 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+How git commands are run. Commands are argument lists, run without a shell,
+so that repo paths and patterns need no quoting.
+
+- 'subprocess' runs a git process per command.
+- 'persistent' also keeps a `git cat-file --batch-check` process per repo,
+  to resolve revisions without starting git again. History walks still take
+  a `git log` process each, as git has no way to serve several of them from
+  one process.
+"""
+
+import shutil
+import subprocess
+import threading
+
+from . import iomanager
+
+DEFAULT_BACKEND = "persistent"
+
+
+class SubprocessBackend:
+    def __init__(self, env):
+        self.env = env
+        self.git = shutil.which("git") or "git"
+
+    def command(self, repo, args):
+        return [self.git, "-C", repo] + list(args)
+
+    def run(self, repo, args):
+        return iomanager.run(self.command(repo, args), env=self.env)
+
+    def stream(self, repo, args, input=None):
+        return iomanager.stream(self.command(repo, args), env=self.env, input=input)
+
+    def resolve(self, repo, rev):
+        """The commit id `rev` points to, or None"""
+        try:
+            out = self.run(
+                repo, ["rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"]
+            )
+        except subprocess.CalledProcessError:
+            return None
+        return out[0]
+
+    def close(self):
+        pass
+
+
+class PersistentBackend(SubprocessBackend):
+    def __init__(self, env):
+        super().__init__(env)
+        self.lock = threading.Lock()
+        self.batches = {}
+
+    def batch(self, repo):
+        if repo not in self.batches:
+            self.batches[repo] = subprocess.Popen(
+                self.command(repo, ["cat-file", "--batch-check"]),
+                env=self.env,
+                text=True,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+        return self.batches[repo]
+
+    def resolve(self, repo, rev):
+        if "\n" in rev:
+            return None
+        with self.lock:
+            batch = self.batch(repo)
+            batch.stdin.write(f"{rev}^{{commit}}\n")
+            batch.stdin.flush()
+            # "<sha> commit <size>", or "<rev> missing" (or "ambiguous")
+            fields = batch.stdout.readline().split()
+        if len(fields) != 3 or fields[1] != "commit":
+            return None
+        return fields[0]
+
+    def close(self):
+        with self.lock:
+            for batch in self.batches.values():
+                batch.stdin.close()
+                batch.wait()
+            self.batches = {}
+
+
+BACKENDS = {
+    "subprocess": SubprocessBackend,
+    "persistent": PersistentBackend,
+}
+
+
+def create(name, env):
+    return BACKENDS[name](env)
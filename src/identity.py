@@ -0,0 +1,177 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import json
+import os
+import re
+import threading
+
+# Characters making an org domain a regex rather than a plain name
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+
+
+class DomainResolver:
+    """
+    Maps email domains to organizations, with the same results as matching
+    them against the regex ".*(alt1|alt2|...)[.].*", where the alternatives
+    are the domains of each org in order. That is: the org whose domain
+    starts the furthest right in the email domain, right before a dot, so
+    that both "xyz.com" and "abc.xyz.com" belong to "xyz".
+
+    Plain domains are looked up in an index of their reversed spelling,
+    walked backwards from each dot of the email domain. If any domain is a
+    regex, the regex itself is used instead. Either way, results are cached
+    per email domain, as there are far less of them than commits.
+    """
+
+    def __init__(self, orgs, org_files, org_domains):
+        alternatives = []
+        for org in orgs:
+            if org in org_domains:
+                alternatives += org_domains[org].split(" ")
+            else:
+                alternatives.append(org)
+        self.orgs = set(orgs)
+        self.org_files = org_files
+        self.org_domains = org_domains
+        self.cache = {}
+        self.regex = None
+        self.index = None
+        if any(REGEX_CHARS & set(alt) for alt in alternatives):
+            self.regex = re.compile(f".*({'|'.join(alternatives)})[.].*")
+        else:
+            self.index = {}
+            for order, alt in enumerate(alternatives):
+                node = self.index
+                for char in reversed(alt):
+                    node = node.setdefault(char, {})
+                # The first alternative wins ties, like in the regex
+                node.setdefault(None, (order, self.owner(alt)))
+
+    def owner(self, name):
+        if name in self.org_files:
+            return name
+        for org_id, aliases in self.org_domains.items():
+            if name in aliases:
+                return org_id
+        return None
+
+    def lookup(self, domain):
+        best = None  # (start, order, org)
+        for end, char in enumerate(domain):
+            if char != ".":
+                continue
+            node = self.index
+            start = end
+            while True:
+                if None in node:
+                    order, org = node[None]
+                    if best is None or (start, -order) > (best[0], -best[1]):
+                        best = (start, order, org)
+                if start == 0 or domain[start - 1] not in node:
+                    break
+                start -= 1
+                node = node[domain[start]]
+        return None if best is None else best[2]
+
+    def resolve(self, domain):
+        if domain in self.cache:
+            return self.cache[domain]
+        if self.index is not None:
+            org = self.lookup(domain)
+        else:
+            found = self.regex.match(domain)
+            org = None if found is None else self.owner(found.group(1))
+        self.cache[domain] = org
+        return org
+
+
+MAILMAP_EMAIL = re.compile(r"<([^>]*)>")
+
+
+def parse_mailmap(text):
+    """
+    The commit email -> proper email mapping of a .mailmap file. Names are
+    not used to attribute commits, so entries only mapping names are left
+    out, and so is the commit name entries may also match on.
+    """
+    emails = {}
+    for line in text.splitlines():
+        line = line.split("#", 1)[0]
+        found = MAILMAP_EMAIL.findall(line)
+        if len(found) == 2 and found[0].strip():
+            emails[found[1].strip().lower()] = found[0].strip().lower()
+    return emails
+
+
+def ere_escape(text):
+    """Escape text for both POSIX extended regexes (git --grep -E) and re"""
+    return "".join(f"\\{c}" if c in REGEX_CHARS else c for c in text)
+
+
+class IdentityIndex:
+    """
+    Maps the email addresses of individuals to their organization, whatever
+    their domain: the members listed in the config, and the addresses that
+    the .mailmap of the repo maps to a member, or to an org domain. Addresses
+    that already belong to an org domain are left to their domain.
+
+    The index only depends on the config and the .mailmap, so it is built
+    for all the orgs of the config, and saved to be reused across runs and
+    repos.
+    """
+
+    def __init__(self, emails, key=None):
+        self.emails = emails
+        self.key = key
+        self.by_org = {}
+        for email, org in emails.items():
+            self.by_org.setdefault(org, []).append(email)
+
+    @classmethod
+    def build(cls, members, mailmap, resolver, key=None):
+        """
+        `members`: org -> emails, `mailmap`: the output of parse_mailmap(), and
+        `resolver`: a DomainResolver for all the orgs of the config
+        """
+        emails = {}
+        for org, addresses in members.items():
+            for email in addresses:
+                emails[email.lower()] = org
+        for alias, proper in mailmap.items():
+            if alias in emails or resolver.resolve(alias.split("@")[-1]):
+                continue
+            org = emails.get(proper) or resolver.resolve(proper.split("@")[-1])
+            if org is not None:
+                emails[alias] = org
+        return cls(emails, key)
+
+    def get(self, email):
+        return self.emails.get(email.lower())
+
+    def emails_of(self, org):
+        return sorted(self.by_org.get(org, []))
+
+    @staticmethod
+    def cache_file(cache_dir, key):
+        return os.path.join(cache_dir, f"identities-{key[:16]}.json")
+
+    @classmethod
+    def load(cls, filename, key):
+        try:
+            with open(filename, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("key") != key:
+            return None
+        return cls(data["emails"], key)
+
+    def save(self, filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"key": self.key, "emails": self.emails}, f)
+        os.replace(tmp, filename)
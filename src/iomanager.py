@@ -4,136 +4,338 @@
 #
 
 import sys
-from progress.bar import Bar
 from termcolor import colored
-from tabulate import tabulate
-import yaml
 import subprocess
 import argparse
+import contextlib
 import os
 import datetime
-import re
+import hashlib
+import json
+import shlex
+import threading
 
-from . import plot, json_parser
+from . import context, gitbackend, identity, json_parser, profiler
+from .identity import DomainResolver, IdentityIndex, parse_mailmap
+from .pathindex import PathIndex
 
-REPO_PATH = ""
-BRANCH = ""
-VERBOSE = False
-ORG_FILES = {}
-ORG_DOMAINS = {}
-KNOWN_ORGS_REGEX = None
 
-
-def warn(msg):
-    if VERBOSE:
+def warn(msg, always=False):
+    """Print a warning with --verbose. Those `always` shown go to stderr."""
+    if always:
+        print(colored(f" [WARN] {msg}", "yellow"), file=sys.stderr)
+    elif context.current().verbose:
         print(colored(f" [WARN] {msg}", "yellow"))
 
 
-def bar(info):
+def bar(info, max=None):
+    """
+    A progress bar. `max` is only needed when iterating over something without
+    a length, like a streamed git log.
+    """
+    from progress.bar import Bar
+
+    kwargs = {} if max is None else {"max": max}
     return Bar(
         info,
         suffix="%(percent).1f%% (%(index).d / %(max).d) [%(elapsed_td)s / %(eta_td)s]",
+        **kwargs,
     )
 
 
 def run(cmd, env=None):
-    if VERBOSE:
+    """
+    Run a command, given as a list of arguments, or as a string for the
+    shell. Returns its output lines.
+    """
+    if context.current().verbose:
         print(colored(f' [INFO] Running "{cmd}" with env "{env}"', "blue"))
-    out = subprocess.check_output(cmd, shell=True, text=True, env=env).strip()
+    if profiler.ACTIVE is not None:
+        profiler.ACTIVE.add_git_call()
+    out = subprocess.check_output(
+        cmd, shell=isinstance(cmd, str), text=True, env=env
+    ).strip()
+    if profiler.ACTIVE is not None:
+        profiler.ACTIVE.add_git_output(len(out.encode()), out.count("\n") + 1)
     if out == "":
         return []
     return out.split("\n")
 
 
+def stream(cmd, env=None, input=None):
+    """
+    Like run(), but yield the output lines as the command produces them, so
+    that the whole output never needs to be held in memory. Raises
+    CalledProcessError once the output is exhausted if the command failed.
+    Closing the generator early kills the command. `input` is written to
+    its stdin, if given.
+    """
+    if context.current().verbose:
+        print(colored(f' [INFO] Streaming "{cmd}" with env "{env}"', "blue"))
+    proc = subprocess.Popen(
+        cmd,
+        shell=isinstance(cmd, str),
+        text=True,
+        errors="replace",
+        env=env,
+        stdin=None if input is None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    if input is not None:
+        threading.Thread(target=write_input, args=(proc.stdin, input)).start()
+    lines = proc.stdout
+    if profiler.ACTIVE is not None:
+        profiler.ACTIVE.add_git_call()
+        lines = counted_lines(proc.stdout)
+    try:
+        for line in lines:
+            yield line.rstrip("\n")
+    except GeneratorExit:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        retcode = proc.wait()
+    if retcode != 0:
+        raise subprocess.CalledProcessError(retcode, cmd)
+
+
+def write_input(pipe, input):
+    # The command may exit, or be killed, before reading it all
+    with contextlib.suppress(BrokenPipeError):
+        with pipe:
+            pipe.write(input)
+
+
+def counted_lines(lines):
+    nbytes = nlines = 0
+    try:
+        for line in lines:
+            nbytes += len(line.encode())
+            nlines += 1
+            yield line
+    finally:
+        profiler.ACTIVE.add_git_output(nbytes, nlines)
+
+
+def use_object_dir(path):
+    """Also read objects, and the commit-graph, from this directory"""
+    ctx = context.current()
+    ctx.git_env = dict(ctx.git_env, GIT_ALTERNATE_OBJECT_DIRECTORIES=path)
+    use_git_backend(ctx.git_backend)
+
+
+def use_git_backend(name):
+    ctx = context.current()
+    ctx.close()
+    ctx.git_backend = name
+
+
+def git_backend():
+    ctx = context.current()
+    if ctx.git is None:
+        ctx.git = gitbackend.create(ctx.git_backend, ctx.git_env)
+    return ctx.git
+
+
+def git_args(cmd):
+    """Git arguments are lists, strings are split like the shell would"""
+    return shlex.split(cmd) if isinstance(cmd, str) else cmd
+
+
 def git(cmd, repo=None):
-    git_env = {
-        "HOME": "",
-        "XDG_CONFIG_HOME": "",
-        "GIT_CONFIG_NOGLOBAL": "1",
-    }
     if repo is None:
-        repo = REPO_PATH
-    return run(f"git -C {repo} {cmd}", env=git_env)
+        repo = context.current().repo_path
+    return git_backend().run(repo, git_args(cmd))
+
+
+def git_stream(cmd, repo=None, input=None):
+    if repo is None:
+        repo = context.current().repo_path
+    return git_backend().stream(repo, git_args(cmd), input)
+
+
+def resolve_commit(rev):
+    repo = context.current().repo_path
+    commit = git_backend().resolve(repo, rev)
+    if commit is None:
+        sys.exit(f"fatal: '{rev}' is not a valid commit in '{repo}'")
+    return commit
 
 
 def gitlog(args):
-    return git(f"log {BRANCH} {args}")
+    return git_stream(["log", context.current().branch] + git_args(args))
+
+
+def count_commits(args):
+    """
+    Number of commits a `gitlog(args)` would list. Much cheaper than the log
+    itself, so it is used to size progress bars over streamed logs.
+    """
+    branch = context.current().branch
+    return int(git(["rev-list", "--count", branch] + git_args(args))[0])
 
 
 def load_config(args):
-    global ORG_FILES
-    global ORG_DOMAINS
-    global KNOWN_ORGS_REGEX
+    """
+    Load args.config, a file name or the parsed config itself, into the
+    current context. Returns the orgs to be highlighted.
+    """
     if args.config is None:
         if args.from_json is None:
             sys.exit("missing required --config file")
         return []
-    with open(args.config) as f:
-        data = yaml.safe_load(f)
-        ORG_FILES = data["org_files"]
-        ORG_DOMAINS = data["org_domains"]
-
-        for k, v in ORG_FILES.items():
-            ORG_FILES[k] = " ".join([f"'*{p}*'" for p in v.split()])
-
-        known_orgs = ORG_FILES.keys()
-        if args.orgs is None or len(args.orgs) == 0:
-            args.orgs = known_orgs
-        elif any(org not in known_orgs for org in args.orgs):
+    if isinstance(args.config, dict):
+        data = args.config
+    else:
+        import yaml
+
+        with open(args.config) as f:
+            data = yaml.safe_load(f)
+
+    ctx = context.current()
+    ctx.org_files = {}
+    ctx.org_domains = dict(data["org_domains"])
+    ctx.org_file_globs = {}
+    for k, v in data["org_files"].items():
+        ctx.org_file_globs[k] = [f"*{p}*" for p in v.split()]
+        ctx.org_files[k] = " ".join([f"'{p}'" for p in ctx.org_file_globs[k]])
+
+    known_orgs = ctx.org_files.keys()
+    if args.orgs is None or len(args.orgs) == 0:
+        args.orgs = list(known_orgs)
+    for org in args.orgs:
+        if org not in known_orgs:
             sys.exit(f"unknown org '{org}'")
 
-        orgs = [
-            c if c not in ORG_DOMAINS else ORG_DOMAINS[c].replace(" ", "|")
-            for c in args.orgs
-        ]
-        KNOWN_ORGS_REGEX = re.compile(f".*({'|'.join(orgs)})[.].*")
-        if "highlight" in data:
-            return data["highlight"]
-    return []
+    ctx.members = {}
+    for org, emails in (data.get("members") or {}).items():
+        if org not in known_orgs:
+            sys.exit(f"members: unknown org '{org}'")
+        ctx.members[org] = emails.split() if isinstance(emails, str) else emails
+
+    ctx.domain_resolver = DomainResolver(args.orgs, ctx.org_files, ctx.org_domains)
+    ctx.path_index = PathIndex(ctx.org_file_globs)
+    ctx.identity_index = None
+    ctx.trailer_matchers = {}
+    return data.get("highlight", [])
+
+
+def cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "ctracker")
+
+
+def load_identities(head):
+    """
+    Index the members of the config, and the .mailmap of the `head` commit.
+    The index is cached, and shared by all the repos with the same .mailmap.
+    """
+    ctx = context.current()
+    try:
+        mailmap = git(["rev-parse", "--verify", "--quiet", f"{head}:.mailmap"])[0]
+    except subprocess.CalledProcessError:
+        mailmap = None
+    key = hashlib.sha256(
+        json.dumps(
+            [mailmap, ctx.members, ctx.org_file_globs, ctx.org_domains],
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+    if ctx.identity_index is not None and ctx.identity_index.key == key:
+        return
+    filename = IdentityIndex.cache_file(cache_dir(), key)
+    index = IdentityIndex.load(filename, key)
+    if index is None:
+        aliases = {}
+        if mailmap is not None:
+            aliases = parse_mailmap("\n".join(git(["cat-file", "blob", mailmap])))
+        resolver = DomainResolver(list(ctx.org_files), ctx.org_files, ctx.org_domains)
+        index = IdentityIndex.build(ctx.members, aliases, resolver, key)
+        if index.emails:
+            try:
+                index.save(filename)
+            except OSError as e:
+                warn(f"could not save the identities cache '{filename}': {e}")
+    ctx.identity_index = index
+    ctx.trailer_matchers = {}
 
 
 def org_email_regex(org):
-    if org in ORG_DOMAINS:
-        org = ORG_DOMAINS[org].replace(" ", "|")
-    return r"@(.+\.)*" f"({org})[.]"
+    """Matches the addresses of an org, in a trailer line"""
+    ctx = context.current()
+    index = ctx.identity_index
+    emails = [] if index is None else index.emails_of(org)
+    if org in ctx.org_domains:
+        org = ctx.org_domains[org].replace(" ", "|")
+    regex = r"@(.+\.)*" f"({org})[.]"
+    if emails:
+        emails = "|".join(map(identity.ere_escape, emails))
+        regex = f"({regex}|[< ]({emails})([> ]|$))"
+    return regex
 
 
 def org_from_email(email):
-    domain = email.split("@")[-1]
-    found = KNOWN_ORGS_REGEX.match(domain)
-    if found is not None:
-        org = found.group(1)
-        if org in ORG_FILES:
-            return org
-        for org_id, aliases in ORG_DOMAINS.items():
-            if org in aliases:
-                return org_id
-    return None  # Unknown org
-
-
-def output_results(args, obj):
-    if args.format == "plot":
-        pretty_names = [
-            metrics_pretty_names[all_metrics.index(h)] for h in obj["metrics"]
+    ctx = context.current()
+    if ctx.identity_index is not None:
+        org = ctx.identity_index.get(email)
+        if org is not None:
+            return org if org in ctx.domain_resolver.orgs else None
+    return ctx.domain_resolver.resolve(email.split("@")[-1])  # None if unknown
+
+
+def sample_rows(results, time_id, rows):
+    """The rows of a time group of --sample estimates, with their intervals"""
+    timestamp = results.timestamps[time_id]
+    low, high = results.sample["low"], results.sample["high"]
+    return [
+        [
+            f"{estimate} [{low[metric][timestamp][org]}, {high[metric][timestamp][org]}]"
+            for metric, estimate in zip(results.metrics, row)
         ]
-        plot.mkplots(args, obj, pretty_names)
-    elif args.format == "json":
-        json_parser.write(f"{args.dir}/{args.repo}.json", obj)
+        for org, row in zip(results.orgs, rows)
+    ]
+
+
+def output_results(args, results):
+    with profiler.stage(f"output:{args.format}"):
+        write_results(args, results)
+
+
+def write_results(args, results):
+    if args.update is not None:
+        columnar = json_parser.is_columnar(args.update)
+        json_parser.save(args.update, results, columnar, args.compress)
+    if args.format == "plot":
+        from . import plot
+
+        plot.mkplots(args, results, pretty_names(results.metrics))
+    elif args.format in ("json", "columnar"):
+        if args.update is None:
+            columnar = args.format == "columnar"
+            ext = json_parser.COLUMNAR_EXTENSION if columnar else ".json"
+            filename = f"{args.dir}/{results.repo}{ext}"
+            json_parser.save(filename, results, columnar, args.compress)
     else:
-        for time_id, time in enumerate(obj["timestamps"]):
+        from tabulate import tabulate
+
+        for time_id, table in enumerate(results.counts):
             print(f"========= TIMEFRAME {time_id}")
-            table = [
-                [obj["data"][header][time][c] for header in obj["metrics"]]
-                for c in obj["orgs"]
-            ]
+            rows = table.T.tolist()
+            if results.sample is not None:
+                rows = sample_rows(results, time_id, rows)
             print(
                 tabulate(
-                    table,
-                    headers=obj["metrics"],
-                    showindex=obj["orgs"],
+                    rows,
+                    headers=results.metrics,
+                    showindex=results.orgs,
                     tablefmt="simple",
                 )
             )
+            if results.top is not None:
+                from . import topn
+
+                topn.print_top(results, time_id)
 
 
 all_metrics = (
@@ -153,7 +355,15 @@ metrics_pretty_names = (
 )
 
 
-def parse_args(args=None):
+def pretty_names(metrics):
+    return [metrics_pretty_names[all_metrics.index(m)] for m in metrics]
+
+
+def parse_args(args=None, config=None):
+    """
+    Parse the command line `args`. `config` is an already parsed config, to
+    be used instead of a --config file.
+    """
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-s", "--since", default="10", help="Since when to count patches (in years)"
@@ -165,7 +375,16 @@ def parse_args(args=None):
         "-v", "--verbose", action="store_true", help="Show infos and warnings"
     )
     parser.add_argument(
-        "-f", "--format", default="cli", help="Output format: cli, json, plot."
+        "-f",
+        "--format",
+        default="cli",
+        help="Output format: cli, json, columnar, plot. 'columnar' is a compact "
+        + "binary alternative to json.",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Compress the output of '--format columnar'.",
     )
     parser.add_argument(
         "-d",
@@ -199,8 +418,12 @@ def parse_args(args=None):
     parser.add_argument(
         "-b",
         "--branch",
-        default="HEAD",
-        help="git branch to be analized. Default to HEAD",
+        nargs="+",
+        dest="branches",
+        metavar="BRANCH",
+        help="git branch to be analized. Several ones are analyzed in a "
+        + "single walk of their history with the 'scan' engine, each with its "
+        + "own results. Default to HEAD",
     )
     parser.add_argument(
         "-r", "--repo", help="path to the git repo to be analized. Default to $PWD"
@@ -208,22 +431,162 @@ def parse_args(args=None):
     parser.add_argument(
         "-j",
         "--from-json",
-        help="Load from json file instead of collecting data from a repo.",
+        help="Load from json (or columnar) file instead of collecting data from "
+        + "a repo.",
     )
     parser.add_argument("--config", help="Config file to use.")
+    parser.add_argument(
+        "--manifest",
+        metavar="YAML",
+        help="Analyze all the repos listed in this file, and summarize them. "
+        + "See examples/manifest.yaml.",
+    )
+    parser.add_argument(
+        "--store",
+        metavar="DB",
+        help="Keep the per-commit facts the metrics are made of in this SQLite "
+        + "file, and gather the metrics from it. Later runs only scan the new "
+        + "commits, whatever the period, orgs or --since.",
+    )
+    parser.add_argument(
+        "--shards",
+        default=1,
+        type=int,
+        help="Split the history in this number of time ranges, gathered in "
+        + "parallel processes. With --manifest, at most the --jobs left to "
+        + "each repo. Default to 1.",
+    )
+    parser.add_argument(
+        "--git-backend",
+        default=gitbackend.DEFAULT_BACKEND,
+        help="How to run git: "
+        + ", ".join(gitbackend.BACKENDS)
+        + f". Default to '{gitbackend.DEFAULT_BACKEND}'.",
+    )
+    parser.add_argument(
+        "--object-dir",
+        metavar="DIR",
+        help="Use the commit-graph written there by 'ctracker prepare "
+        + "--object-dir'.",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="JSON",
+        help="Save the time, git commands and memory used by each stage of the "
+        + "run to this file.",
+    )
+    parser.add_argument(
+        "--cprofile",
+        metavar="FILE",
+        help="With --profile, also dump the cProfile stats of the metrics "
+        + "collection to this file. See the pstats module.",
+    )
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        type=int,
+        help="Run up to this number of git queries in parallel with the "
+        + "'query' engine, of repos with --manifest, or of charts with "
+        + "'--format plot'. Default to 1.",
+    )
+    parser.add_argument(
+        "--sample",
+        type=float,
+        metavar="RATE",
+        help="Quick estimate from a sample of this ratio of the commits, "
+        + "scaled up, with 95%% confidence intervals. Uses the 'scan' engine.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Which sample --sample takes. Default to 0",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        metavar="N",
+        help="Also rank the N top authors and reviewers of each organization "
+        + "in each period, in the json and cli outputs.",
+    )
+    parser.add_argument(
+        "--top-capacity",
+        type=int,
+        metavar="K",
+        help="Number of contributors --top keeps count of per organization and "
+        + "period. Counts are exact with fewer contributors, and otherwise "
+        + "overestimated by at most the reported error. Default to 10 x N.",
+    )
+    parser.add_argument(
+        "-u",
+        "--update",
+        metavar="JSON",
+        help="Update a json file generated by a previous run with the commits "
+        + "added to its branch since then, and rewrite it. The organizations, "
+        + "metrics and period are taken from the file.",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        default="query",
+        help="How to collect data: 'query' runs one git log per metric and "
+        + "organization, 'scan' gathers all metrics from a single pass over the "
+        + "history. Default to 'query'.",
+    )
     args = parser.parse_args(args)
+    if config is not None:
+        args.config = config
+
+    context.current().verbose = args.verbose
+
+    if args.cprofile is not None and args.profile is None:
+        sys.exit("--cprofile requires --profile")
+    if args.profile is not None:
+        profiler.start(args.profile, args.cprofile)
 
-    global VERBOSE
-    VERBOSE = args.verbose
+    if args.git_backend not in gitbackend.BACKENDS:
+        sys.exit(
+            f"unknown --git-backend '{args.git_backend}'. Known ones: "
+            + ", ".join(gitbackend.BACKENDS)
+        )
+    use_git_backend(args.git_backend)
+    if args.object_dir is not None:
+        use_object_dir(os.path.abspath(args.object_dir))
 
-    global REPO_PATH
     if args.repo is None:
         args.repo = os.getcwd()
-    REPO_PATH = args.repo
+    repo_path = args.repo
     args.repo = os.path.basename(args.repo)
 
-    global BRANCH
-    BRANCH = args.branch
+    previous = None
+    if args.update is not None:
+        if args.from_json is not None:
+            sys.exit("--update and --from-json are mutually exclusive")
+        previous = json_parser.read(args.update)
+        if "scan" not in previous:
+            sys.exit(
+                f"--update: '{args.update}' has no incremental data. "
+                + "Please regenerate it with a full run first."
+            )
+        args.orgs = previous["orgs"]
+        args.metrics = previous["metrics"]
+        args.period = previous["time_period_days"]
+        branch = previous["scan"]["branch"]
+        if args.branches is not None and args.branches != [branch]:
+            sys.exit(
+                f"--update: '{args.update}' is of branch '{branch}', "
+                + f"not {' '.join(args.branches)}"
+            )
+        args.branches = [branch]
+        if args.top is None and "top" in previous:
+            args.top = previous["top"]["n"]
+            args.top_capacity = previous["top"]["capacity"]
+
+    if args.manifest is not None and (args.update or args.from_json):
+        sys.exit("--manifest cannot be used with --update or --from-json")
+    if args.branches is None:
+        args.branches = ["HEAD"]
+    args.branch = args.branches[0]
 
     no_metrics = [e for e in args.metrics if e.startswith("^")]
     args.metrics = [e for e in args.metrics if not e.startswith("^")]
@@ -231,10 +594,42 @@ def parse_args(args=None):
         args.metrics = all_metrics
     args.metrics = [e for e in args.metrics if f"^{e}" not in no_metrics]
 
-    if args.format not in ("plot", "json", "cli"):
+    if args.format not in ("plot", "json", "columnar", "cli"):
         sys.exit("unknown --format")
 
-    if args.format in ("plot", "json") and not os.path.isdir(args.dir):
+    if args.engine not in ("query", "scan"):
+        sys.exit("unknown --engine")
+
+    if args.jobs < 1:
+        sys.exit("--jobs must be at least 1")
+    if args.shards < 1:
+        sys.exit("--shards must be at least 1")
+    if args.sample is not None:
+        if not 0 < args.sample <= 1:
+            sys.exit("--sample must be in ]0, 1]")
+        if args.update or args.store or args.top:
+            sys.exit("--sample cannot be used with --update, --store or --top")
+        args.engine = "scan"
+    if len(args.branches) > 1:
+        if args.update or args.store or args.top or args.sample or args.shards > 1:
+            sys.exit(
+                "several --branch cannot be used with --update, --store, --top, "
+                + "--sample or --shards"
+            )
+        if args.manifest or args.from_json:
+            sys.exit("several --branch cannot be used with --manifest or --from-json")
+        args.engine = "scan"
+    if args.top is not None:
+        if args.top < 1:
+            sys.exit("--top must be at least 1")
+        if args.top_capacity is None:
+            args.top_capacity = 10 * args.top
+        elif args.top_capacity < args.top:
+            sys.exit("--top-capacity must be at least --top")
+    if args.store is not None and (args.update or args.shards > 1):
+        sys.exit("--store cannot be used with --update or --shards")
+
+    if args.format in ("plot", "json", "columnar") and not os.path.isdir(args.dir):
         try:
             os.mkdir(args.dir)
         except Exception as e:
@@ -246,8 +641,9 @@ def parse_args(args=None):
     if args.highlight is None:
         args.highlight = []
     args.highlight += config_highlight
-    if any(org not in args.orgs for org in args.highlight):
-        sys.exit(f"invalid --highlight option: '{org}' is not in --orgs")
+    for org in args.highlight:
+        if org not in args.orgs:
+            sys.exit(f"invalid --highlight option: '{org}' is not in --orgs")
 
     timeframe_years = int(args.since)
     timeframe_days = timeframe_years * 365
@@ -258,10 +654,69 @@ def parse_args(args=None):
         args.period = timeframe_days
 
     # Push derivative args for convenience
-    args.__dict__["groups"] = timeframe_days // args.period
-    today = datetime.date.today()
-    initial = int(today.replace(year=(today.year - timeframe_years)).strftime("%s"))
-    args.__dict__["initial_timestamp"] = initial
     args.__dict__["timeframe_years"] = timeframe_years
+    set_window(args, previous)
+
+    if args.from_json is None and args.manifest is None:
+        select_repo(args, repo_path)
 
     return args
+
+
+def set_window(args, previous=None):
+    """
+    Set the time bins of the analysis up to today, from --since and --period,
+    or continuing those of the results of a previous run to be updated.
+    """
+    args.__dict__["groups"] = args.timeframe_years * 365 // args.period
+    today = datetime.date.today()
+    initial = today.replace(year=(today.year - args.timeframe_years))
+    args.__dict__["initial_timestamp"] = int(initial.strftime("%s"))
+    args.__dict__["previous"] = previous
+
+    if previous is not None:
+        # Keep the bins of the previous run, opening new ones as time goes by
+        initial = previous["scan"]["initial_timestamp"]
+        args.initial_timestamp = initial
+        args.since = f"--since=@{initial}"
+        days = (today - datetime.date.fromtimestamp(initial)).days
+        args.groups = max(len(previous["timestamps"]), days // args.period)
+
+    # Commits are counted in raw bins up to today, not clamped to the last
+    # group, so that they can be regrouped when a later --update opens new
+    # groups. See results.fold().
+    days = (today - datetime.date.fromtimestamp(args.initial_timestamp)).days
+    args.__dict__["bins"] = max(args.groups, days // args.period + 1)
+
+
+def select_repo(args, path):
+    """
+    Point the git queries to the repo at `path`, and resolve the branches to
+    be analyzed there. The identities are those of the first branch.
+    """
+    ctx = context.current()
+    ctx.repo_path = path
+    args.repo = os.path.basename(path)
+    args.__dict__["heads"] = [resolve_commit(branch) for branch in args.branches]
+    args.__dict__["head"] = args.heads[0]
+    ctx.branch = args.head
+    load_identities(args.head)
+    if args.previous is not None:
+        last = args.previous["scan"]["head"]
+        try:
+            git(f"merge-base --is-ancestor {last} {args.head}")
+        except subprocess.CalledProcessError:
+            sys.exit(
+                f"--update: '{last}' is no longer in '{args.branch}'. "
+                + "Please regenerate the file with a full run."
+            )
+        ctx.branch = f"{last}..{args.head}"
+
+
+def config_state():
+    """The current context, to set up other processes with restore_config()"""
+    return context.current().detached()
+
+
+def restore_config(state):
+    context.set_default(state)
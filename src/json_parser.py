@@ -4,12 +4,32 @@
 #
 
 import json
-import datetime
+import numpy as np
+
+from .results import Results
 
 JSON_VERSION = 1.0
 
+# The columnar format is a numpy .npz archive (a zip file) with one
+# [groups x orgs] array per metric, under "data/<metric>", and a "header"
+# array holding the utf-8 json encoding of everything else. Raw counts for
+# `--update` are stored the same way, under "scan/<metric>".
+COLUMNAR_FORMAT = "ctracker-columnar"
+COLUMNAR_VERSION = 1
+COLUMNAR_EXTENSION = ".npz"
+ZIP_MAGIC = b"PK\x03\x04"
+
+
+def is_columnar(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(ZIP_MAGIC)) == ZIP_MAGIC
+
 
 def read(filename):
+    """The json object of a results file, in either format"""
+    if is_columnar(filename):
+        with load_columnar(filename) as results:
+            return serialize(results)
     with open(filename, "r") as f:
         return json.load(f)
 
@@ -20,25 +40,168 @@ def write(filename, json_obj):
     print(f"saved {filename}")
 
 
-def generate(args, results, headers):
+class ColumnLoader:
+    """Loads the columns of a columnar archive, until closed"""
+
+    def __init__(self, archive):
+        self.archive = archive
+
+    def __call__(self, metric):
+        return self.archive[f"data/{metric}"]
+
+    def close(self):
+        self.archive.close()
+
+
+def load_columnar(filename):
+    """
+    The Results of a columnar file. Its columns are loaded as they are used,
+    from the file kept open until Results.close().
+    """
+    archive = np.load(filename)
+    try:
+        header = json.loads(bytes(archive["header"]).decode())
+        if header.get("format") != COLUMNAR_FORMAT:
+            raise ValueError(f"'{filename}' is not a ctracker results file")
+        if header["version"] > COLUMNAR_VERSION:
+            raise ValueError(
+                f"'{filename}' uses version {header['version']} of the columnar "
+                + f"format, only versions up to {COLUMNAR_VERSION} are supported"
+            )
+        scan = header.get("scan")
+        if scan is not None:
+            scan["raw"] = np.stack(
+                [archive[f"scan/{metric}"] for metric in header["metrics"]], axis=1
+            )
+    except BaseException:
+        archive.close()
+        raise
+    return Results(
+        header["repo"],
+        header["time_period_days"],
+        header["timestamps"],
+        header["metrics"],
+        header["orgs"],
+        ColumnLoader(archive),
+        header["gen_time"],
+        scan,
+        header.get("top"),
+        header.get("sample"),
+    )
+
+
+def write_columnar(filename, results, compress=False):
+    header = {
+        "format": COLUMNAR_FORMAT,
+        "version": COLUMNAR_VERSION,
+        "gen_time": str(results.gen_time),
+        "time_period_days": results.period,
+        "repo": results.repo,
+        "timestamps": results.timestamps,
+        "metrics": results.metrics,
+        "orgs": results.orgs,
+    }
+    if results.top is not None:
+        header["top"] = results.top
+    if results.sample is not None:
+        header["sample"] = results.sample
+    arrays = {f"data/{metric}": results.column(metric) for metric in results.metrics}
+    if results.scan is not None:
+        header["scan"] = {k: v for k, v in results.scan.items() if k != "raw"}
+        for metric_id, metric in enumerate(results.metrics):
+            arrays[f"scan/{metric}"] = results.scan["raw"][:, metric_id]
+    arrays["header"] = np.frombuffer(json.dumps(header).encode(), dtype=np.uint8)
+    # Write through a file object, or numpy would append ".npz" to the name
+    with open(filename, "wb") as f:
+        (np.savez_compressed if compress else np.savez)(f, **arrays)
+    print(f"saved {filename}")
+
+
+def load(filename):
+    """
+    Results from a file in either format. Columnar ones are read lazily, and
+    should be closed once used, see Results.close().
+    """
+    if is_columnar(filename):
+        return load_columnar(filename)
+    return deserialize(read(filename))
+
+
+def save(filename, results, columnar=False, compress=False):
+    if columnar:
+        write_columnar(filename, results, compress)
+    else:
+        write(filename, serialize(results))
+
+
+def convert(src, dst, compress=False):
+    """
+    Convert a results file to the format given by the extension of `dst`:
+    columnar for .npz files, json otherwise.
+    """
+    with load(src) as results:
+        save(dst, results, dst.endswith(COLUMNAR_EXTENSION), compress)
+
+
+def serialize(results):
     json_obj = {}
-    initial = datetime.date.fromtimestamp(args.initial_timestamp)
     json_obj["version"] = JSON_VERSION
-    json_obj["gen_time"] = datetime.date.today()
-    json_obj["time_period_days"] = args.period
-    json_obj["repo"] = args.repo
-    json_obj["timestamps"] = [
-        str(initial + datetime.timedelta(days=(args.period * i)))
-        for i in range(args.groups)
-    ]
-    json_obj["metrics"] = headers
-    json_obj["orgs"] = list(args.orgs)
+    json_obj["gen_time"] = results.gen_time
+    json_obj["time_period_days"] = results.period
+    json_obj["repo"] = results.repo
+    json_obj["timestamps"] = results.timestamps
+    json_obj["metrics"] = results.metrics
+    json_obj["orgs"] = results.orgs
     json_obj["data"] = {
-        header: {
-            time: {org: results[time_id][header_id][org] for org in args.orgs}
-            for time_id, time in enumerate(json_obj["timestamps"])
+        metric: {
+            time: dict(zip(results.orgs, counts))
+            for time, counts in zip(results.timestamps, results.column(metric).tolist())
         }
-        for header_id, header in enumerate(headers)
+        for metric in results.metrics
     }
-
+    if results.scan is not None:
+        raw = {
+            metric: results.scan["raw"][:, metric_id].tolist()
+            for metric_id, metric in enumerate(results.metrics)
+        }
+        json_obj["scan"] = dict(results.scan, raw=raw)
+    if results.top is not None:
+        json_obj["top"] = results.top
+    if results.sample is not None:
+        json_obj["sample"] = results.sample
     return json_obj
+
+
+def deserialize(json_obj):
+    counts = np.array(
+        [
+            [
+                [json_obj["data"][metric][time][org] for org in json_obj["orgs"]]
+                for metric in json_obj["metrics"]
+            ]
+            for time in json_obj["timestamps"]
+        ],
+        dtype=np.int64,
+    ).reshape(
+        len(json_obj["timestamps"]), len(json_obj["metrics"]), len(json_obj["orgs"])
+    )
+    scan = json_obj.get("scan")
+    if scan is not None:
+        raw = [np.array(scan["raw"][metric]) for metric in json_obj["metrics"]]
+        scan = dict(scan, raw=np.stack(raw, axis=1))
+    return Results(
+        json_obj["repo"],
+        json_obj["time_period_days"],
+        json_obj["timestamps"],
+        json_obj["metrics"],
+        json_obj["orgs"],
+        counts,
+        json_obj["gen_time"],
+        scan,
+        json_obj.get("top"),
+        json_obj.get("sample"),
+    )
+
+
+def generate(args, results, headers):
+    return serialize(Results.from_args(args, results, headers))
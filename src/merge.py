@@ -0,0 +1,260 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+`ctracker merge`: combine results produced separately, by other machines for
+instance, into a single results file. Inputs can be of any format, and cover:
+
+- different orgs: their columns are put side by side,
+- different repos, or different time ranges of a repo: their counts are
+  added up, on the union of their time groups.
+
+All inputs must have the same period and metrics, and time groups on the
+same grid, which runs with the same --period made on the same day have.
+Counting the same commits twice, from two inputs of the same head with
+common orgs, or from clones of a repo at different heads, is refused.
+
+The data needed by --update is only kept when all inputs are org subsets of
+the same head, and the top contributors when all the orgs are distinct.
+"""
+
+import argparse
+import datetime
+import sys
+import numpy as np
+
+from . import iomanager, json_parser
+from .results import KINDS, Results
+
+
+def day(timestamp):
+    return datetime.date.fromisoformat(timestamp)
+
+
+def time_grid(inputs, period):
+    """The timestamps of the union of the time groups of the inputs"""
+    starts = sorted({day(t) for r in inputs for t in r.timestamps})
+    for start in starts:
+        if (start - starts[0]).days % period != 0:
+            raise ValueError(
+                f"time groups starting on {starts[0]} and {start} are not "
+                + f"{period} days apart; the inputs must be made on the same day"
+            )
+    groups = (starts[-1] - starts[0]).days // period + 1
+    return [str(starts[0] + datetime.timedelta(days=period * i)) for i in range(groups)]
+
+
+def check_compatible(inputs):
+    first = inputs[0]
+    for r in inputs:
+        if r.sample is not None:
+            raise ValueError(f"'{r.repo}' holds --sample estimates, not counts")
+    for r in inputs[1:]:
+        if r.period != first.period:
+            raise ValueError(
+                f"'{first.repo}' has {first.period} days periods, "
+                + f"'{r.repo}' has {r.period}"
+            )
+        if sorted(r.metrics) != sorted(first.metrics):
+            raise ValueError(
+                f"'{first.repo}' has metrics {first.metrics}, "
+                + f"'{r.repo}' has {r.metrics}"
+            )
+
+
+def head(results):
+    return None if results.scan is None else results.scan["head"]
+
+
+def active_groups(results, org):
+    """The timestamps of the time groups where `org` has counts"""
+    org_id = results.orgs.index(org)
+    active = sum(results.column(metric)[:, org_id] for metric in results.metrics)
+    return {t for t, count in zip(results.timestamps, active.tolist()) if count}
+
+
+def check_disjoint(inputs, allow_overlap=False):
+    """
+    Refuse to count the orgs of a head twice, or those of clones of a repo:
+    inputs of the same repo name with counts of the same org in the same
+    time group, where a commit both count would be. Inputs without --update
+    data, whose ranges are not known, are only warned about.
+    """
+    for i, a in enumerate(inputs):
+        for b in inputs[i + 1 :]:
+            common = set(a.orgs) & set(b.orgs)
+            if head(a) is not None and head(a) == head(b) and common:
+                raise ValueError(
+                    f"two inputs count {sorted(common)} at the same head "
+                    + f"{head(a)}, merging would count them twice"
+                )
+            if a.repo != b.repo or allow_overlap:
+                continue
+            for org in sorted(common):
+                overlap = active_groups(a, org) & active_groups(b, org)
+                if not overlap:
+                    continue
+                msg = (
+                    f"two inputs of '{a.repo}' count {org} in the {min(overlap)} "
+                    + "time group. If they are clones of the same repo, their "
+                    + "common history is counted twice"
+                )
+                if head(a) is None or head(b) is None:
+                    iomanager.warn(msg, always=True)
+                    break
+                raise ValueError(
+                    msg + ". Use --allow-overlap if they are different repos"
+                )
+
+
+def merge_scan(inputs, orgs, metrics):
+    """The --update data of the merged results, if it can be kept"""
+    if any(r.scan is None for r in inputs):
+        return None
+    keys = {
+        (
+            r.scan["branch"],
+            r.scan["head"],
+            r.scan["initial_timestamp"],
+            len(r.scan["raw"]),
+        )
+        for r in inputs
+    }
+    if len(keys) != 1:
+        return None
+    branch, head, initial_timestamp, bins = keys.pop()
+    raw = np.zeros((bins, len(metrics), len(orgs)), dtype=np.int64)
+    for r in inputs:
+        for metric_id, metric in enumerate(metrics):
+            for org_id, org in enumerate(r.orgs):
+                raw[:, metric_id, orgs.index(org)] = r.scan["raw"][
+                    :, r.metrics.index(metric), org_id
+                ]
+    return {
+        "branch": branch,
+        "head": head,
+        "initial_timestamp": initial_timestamp,
+        "raw": raw,
+    }
+
+
+def merge_top(inputs, scan):
+    """
+    The top section of the merged results, if it can be kept, with the
+    summaries --update goes on with if the merged results can be updated
+    """
+    if any(r.top is None for r in inputs):
+        return None
+    if len({(r.top["n"], r.top["capacity"]) for r in inputs}) != 1:
+        return None
+    if sum(len(r.orgs) for r in inputs) != len({org for r in inputs for org in r.orgs}):
+        return None  # Rankings cannot be added up
+    top = {"n": inputs[0].top["n"], "capacity": inputs[0].top["capacity"]}
+    for kind in KINDS:
+        top[kind] = {}
+        for r in inputs:
+            for timestamp, by_org in r.top[kind].items():
+                top[kind].setdefault(timestamp, {}).update(by_org)
+    if scan is not None and all("summaries" in r.top for r in inputs):
+        bins = len(scan["raw"])
+        top["summaries"] = {kind: [{} for _ in range(bins)] for kind in KINDS}
+        for r in inputs:
+            for kind in KINDS:
+                for merged, by_org in zip(
+                    top["summaries"][kind], r.top["summaries"][kind]
+                ):
+                    merged.update(by_org)
+    return top
+
+
+def merge(inputs, name=None, allow_overlap=False):
+    """
+    Merge a list of Results, see above. Raises ValueError if they do not fit.
+    `allow_overlap` sums the counts of inputs of the same repo name anyway.
+    """
+    check_compatible(inputs)
+    check_disjoint(inputs, allow_overlap)
+    metrics = list(inputs[0].metrics)
+    orgs = []
+    for r in inputs:
+        orgs += [org for org in r.orgs if org not in orgs]
+    timestamps = time_grid(inputs, inputs[0].period)
+
+    counts = np.zeros((len(timestamps), len(metrics), len(orgs)), dtype=np.int64)
+    for r in inputs:
+        rows = [timestamps.index(t) for t in r.timestamps]
+        columns = [orgs.index(org) for org in r.orgs]
+        for metric_id, metric in enumerate(metrics):
+            counts[np.ix_(rows, [metric_id], columns)] += r.column(metric)[
+                :, np.newaxis, :
+            ]
+
+    scan = merge_scan(inputs, orgs, metrics)
+    if name is None:
+        names = list(dict.fromkeys(r.repo for r in inputs))
+        name = "+".join(names)
+    return Results(
+        name,
+        inputs[0].period,
+        timestamps,
+        metrics,
+        orgs,
+        counts,
+        datetime.date.today(),
+        scan,
+        merge_top(inputs, scan),
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="ctracker merge",
+        description="Combine results files, of different orgs, repos or time "
+        + "ranges, into a single one.",
+    )
+    parser.add_argument("inputs", nargs="+", metavar="FILE", help="Results to merge")
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="Where to save the merged results. Columnar if it ends with "
+        + f"'{json_parser.COLUMNAR_EXTENSION}', json otherwise.",
+    )
+    parser.add_argument(
+        "--name", help="Repo name of the merged results. Default to the input ones."
+    )
+    parser.add_argument(
+        "--allow-overlap",
+        action="store_true",
+        help="Add up inputs of the same repo name counting the same orgs in the "
+        + "same time groups, which clones of a repo are refused for.",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Compress the output, if columnar.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    inputs = []
+    try:
+        for filename in args.inputs:
+            inputs.append(json_parser.load(filename))
+        merged = merge(inputs, args.name, args.allow_overlap)
+    except (OSError, ValueError) as e:
+        sys.exit(f"ctracker merge: {e}")
+    finally:
+        # The merged counts are copies of the input ones
+        for r in inputs:
+            r.close()
+    if merged.scan is None and all(r.scan is not None for r in inputs):
+        iomanager.warn(
+            "The merged results cannot be updated with --update", always=True
+        )
+    columnar = args.output.endswith(json_parser.COLUMNAR_EXTENSION)
+    json_parser.save(args.output, merged, columnar, args.compress)
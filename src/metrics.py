@@ -3,17 +3,54 @@
 # SPDX-License-Identifier: BSD-3-Clause
 #
 
+import contextlib
+import copy
+import hashlib
+import os
 import re
 import sys
-from collections import Counter
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cached_property
 
-from . import iomanager
+from . import context, iomanager, profiler
+from .results import Tally, bin_edges
 
 # A separator for `git log --format fields`
 SEP = "§"  # not valid for email addresses
-COMMON_LOG_OPTS = f"--no-merges --format='%ae{SEP}%ad' --date='format:%s'"
+COMMON_LOG_OPTS = ["--no-merges", f"--format=%ae{SEP}%ad", "--date=format:%s"]
+
+# Commit delimiters for the single-pass scan. The header line starts with
+# COMMIT_START and the raw message is closed by MESSAGE_END, after which come
+# the changed paths. Renames are split so that both the old and the new path
+# are listed, like a pathspec query would see them.
+COMMIT_START = "\x02"
+MESSAGE_END = "\x03"
+SCAN_LOG_OPTS = [
+    "-c",
+    "core.quotePath=false",
+    "log",
+    "--no-merges",
+    "--no-renames",
+    "--name-only",
+    f"--format=%x02%H{SEP}%ae{SEP}%ad%n%B%x03",
+    "--date=format:%s",
+]
+
+# Like SCAN_LOG_OPTS, with the parents of each commit, and the merges through
+# which branches share history. See scan_branches().
+BRANCHES_LOG_OPTS = [opt for opt in SCAN_LOG_OPTS[:-2] if opt != "--no-merges"] + [
+    "--topo-order",
+    f"--format=%x02%H{SEP}%ae{SEP}%ad{SEP}%ct{SEP}%P%n%B%x03",
+    "--date=format:%s",
+]
+
+REVIEW_TRAILERS = "acked-by|tested-by|reviewed-by"
+REPORT_TRAILERS = "reported-by|suggested-by"
 
 metric_registry = {}
+scan_registry = {}
+query_registry = {}
 
 
 def register_metric(func):
@@ -21,118 +58,548 @@ def register_metric(func):
     return func
 
 
-def secs_to_days(secs):
-    return secs // 60 // 60 // 24
+def register_queries(*metrics):
+    """
+    Register a function queueing the per-org queries the given metrics will
+    consume, so that they can start in the background ahead of time.
+    """
 
+    def wrapper(func):
+        for metric in metrics:
+            query_registry[metric] = func
+        return func
 
-def bin_num(args, timestamp):
-    timestamp = int(timestamp)
-    num = secs_to_days(timestamp - args.initial_timestamp) // args.period
-    if num < 0:
-        num = 0
-    elif num >= args.groups:
-        num = args.groups - 1
-    return num
+    return wrapper
 
 
-cache_patches_to_org_files = {}
+def register_scan(metric):
+    """
+    Register the single-pass counterpart of a metric: a function taking the
+    args and a ScannedCommit, and returning the orgs to be credited for it.
+    """
 
+    def wrapper(func):
+        scan_registry[metric] = func
+        return func
 
-def patches_to_org_files(args, org):
-    if org in cache_patches_to_org_files:
-        return cache_patches_to_org_files[org]
-    patches_by_org = [Counter() for _ in range(args.groups)]
+    return wrapper
+
+
+def queue(query, args, param):
+    """
+    Run query(args, param) in the worker pool of the context, or right away
+    if there is none, unless it was already queued with the same inputs.
+    Returns the memoized Future.
+    """
+    ctx = context.current()
+    key = (
+        query.__name__,
+        ctx.repo_path,
+        ctx.branch,
+        ctx.identity_index.key,  # Covers the config
+        args.since,
+        args.initial_timestamp,
+        args.period,
+        args.bins,
+        tuple(args.orgs),
+        param,
+    )
+
+    def submit():
+        if ctx.pool is None:
+            return context.completed(query(args, param))
+        return ctx.pool.submit(context.bind(query), args, param)
+
+    return ctx.memo.get(key, submit)
+
+
+def org_files_query(args, org):
+    """[bins x orgs + 1] patches to the org files by author org"""
+    patches_by_org = Tally(args)
     log = iomanager.gitlog(
-        f"{COMMON_LOG_OPTS} {args.since} -- {iomanager.ORG_FILES[org]}"
+        COMMON_LOG_OPTS
+        + args.since.split()
+        + ["--"]
+        + context.current().org_file_globs[org]
     )
     for line in log:
         author, timestamp = line.split(SEP)
-        patches_by_org[bin_num(args, timestamp)][iomanager.org_from_email(author)] += 1
-    cache_patches_to_org_files[org] = patches_by_org
-    return patches_by_org
+        patches_by_org.add(iomanager.org_from_email(author), timestamp)
+    return patches_by_org.result(untracked=True)
+
+
+@register_queries("internal_patches_to_org_files", "external_patches_to_org_files")
+def queue_org_files(args):
+    return [queue(org_files_query, args, org) for org in args.orgs]
+
+
+def patches_to_org_files(args, org):
+    return queue(org_files_query, args, org).result()
 
 
 @register_metric
 def total_patches(args):
-    total_patches = [Counter({org: 0 for org in args.orgs}) for _ in range(args.groups)]
-    log = iomanager.gitlog(f"{COMMON_LOG_OPTS} {args.since}")
-    for line in iomanager.bar("Counting total patches").iter(log):
+    total_patches = Tally(args)
+    log = iomanager.gitlog(COMMON_LOG_OPTS + args.since.split())
+    total = iomanager.count_commits(["--no-merges"] + args.since.split())
+    for line in iomanager.bar("Counting total patches", total).iter(log):
         email, timestamp = line.split(SEP)
-        org = iomanager.org_from_email(email)
-        total_patches[bin_num(args, timestamp)][org] += 1
-    return total_patches
+        total_patches.add(iomanager.org_from_email(email), timestamp)
+    return total_patches.result()
 
 
 @register_metric
 def internal_patches_to_org_files(args):
-    patches = [Counter() for _ in range(args.groups)]
-    for org in iomanager.bar("Counting internal patches to organization files").iter(
-        args.orgs
+    patches = np.zeros((args.bins, len(args.orgs)), dtype=np.int64)
+    for i, org in enumerate(
+        iomanager.bar("Counting internal patches to organization files").iter(args.orgs)
     ):
-        patches_by_org = patches_to_org_files(args, org)
-        for i in range(args.groups):
-            patches[i][org] = patches_by_org[i][org]
+        patches[:, i] = patches_to_org_files(args, org)[:, i]
     return patches
 
 
 @register_metric
 def external_patches_to_org_files(args):
-    patches = [Counter() for _ in range(args.groups)]
-    for org in iomanager.bar("Counting external patches to organization files").iter(
-        args.orgs
+    patches = np.zeros((args.bins, len(args.orgs)), dtype=np.int64)
+    for i, org in enumerate(
+        iomanager.bar("Counting external patches to organization files").iter(args.orgs)
     ):
         patches_by_org = patches_to_org_files(args, org)
-        for i in range(args.groups):
-            for other_orgs in patches_by_org[i].keys() - [org]:
-                patches[i][org] += patches_by_org[i][other_orgs]
+        patches[:, i] = patches_by_org.sum(1) - patches_by_org[:, i]
     return patches
 
 
+def clear_caches():
+    """Forget the results of the per-org queries, see queue()"""
+    context.current().memo.clear()
+
+
+def grep_criteria_query(args, regex):
+    """[bins] patches matching the regex"""
+    patches = Tally(args, [None])
+    log_args = COMMON_LOG_OPTS + args.since.split() + [f"--grep={regex}", "-i", "-E"]
+    for line in iomanager.gitlog(log_args):
+        email, timestamp = line.split(SEP)
+        patches.add(None, timestamp)
+    return patches.result()[:, 0]
+
+
+def queue_grep_criteria(args, regexfn):
+    return [queue(grep_criteria_query, args, regexfn(org)) for org in args.orgs]
+
+
 def count_by_grep_criteria(args, regexfn, bar_info):
-    results = [Counter() for _ in range(args.groups)]
-    for org in iomanager.bar(bar_info).iter(args.orgs):
-        log_args = f"{COMMON_LOG_OPTS} {args.since} --grep='{regexfn(org)}' -i -E"
-        for line in iomanager.gitlog(log_args):
-            email, timestamp = line.split(SEP)
-            results[bin_num(args, timestamp)][org] += 1
+    results = np.zeros((args.bins, len(args.orgs)), dtype=np.int64)
+    queries = queue_grep_criteria(args, regexfn)
+    for i, query in enumerate(iomanager.bar(bar_info).iter(queries)):
+        results[:, i] = query.result()
     return results
 
 
+def trailer_regex(trailers, org):
+    return f"({trailers}):.*{iomanager.org_email_regex(org)}"
+
+
+def reviewed_regex(org):
+    return trailer_regex(REVIEW_TRAILERS, org)
+
+
+def reported_regex(org):
+    return trailer_regex(REPORT_TRAILERS, org)
+
+
 @register_metric
 def reviewed_patches(args):
-    regexfn = (
-        lambda org: f"(acked-by|tested-by|reviewed-by):.*{iomanager.org_email_regex(org)}"
-    )
     bar_info = "Counting org-reviewed patches"
-    return count_by_grep_criteria(args, regexfn, bar_info)
+    return count_by_grep_criteria(args, reviewed_regex, bar_info)
+
+
+@register_queries("reviewed_patches")
+def queue_reviewed_patches(args):
+    return queue_grep_criteria(args, reviewed_regex)
 
 
 @register_metric
 def reported_by_patches(args):
-    regexfn = (
-        lambda org: f"(reported-by|suggested-by):.*{iomanager.org_email_regex(org)}"
-    )
     bar_info = "Counting org-reported patches"
-    return count_by_grep_criteria(args, regexfn, bar_info)
+    return count_by_grep_criteria(args, reported_regex, bar_info)
 
 
-def gather_stats(args):
-    if any(metric not in metric_registry for metric in args.metrics):
-        sys.exit(
-            f"FATAL: unknown metric '{metric}'. "
-            + "Known ones:\n"
-            + "\n".join(iomanager.all_metrics)
+@register_queries("reported_by_patches")
+def queue_reported_by_patches(args):
+    return queue_grep_criteria(args, reported_regex)
+
+
+class ScannedCommit:
+    """
+    A commit read by the single-pass scan. The derived org information is
+    only computed when a metric asks for it, and at most once per commit.
+    """
+
+    def __init__(self, args, sha, email, timestamp, committed=None, parents=""):
+        self.args = args
+        self.sha = sha
+        self.email = email
+        self.timestamp = timestamp
+        self.committed = committed
+        self.parents = parents.split()
+        self.message = []
+        self.paths = []
+
+    @cached_property
+    def org(self):
+        return iomanager.org_from_email(self.email)
+
+    @cached_property
+    def file_owners(self):
+        path_index = context.current().path_index
+        return path_index.classify(self.paths).intersection(self.args.orgs)
+
+    def has_trailer(self, trailers, org):
+        # Same criteria as `git log --grep -i -E`, which matches line by line
+        keywords, regex = trailer_matchers(trailers, org)
+        return any(
+            keywords.search(line) is not None and regex.search(line) is not None
+            for line in self.message
         )
 
+
+def trailer_matchers(trailers, org):
+    """
+    The compiled regexes of the trailers of an org. They are kept in the
+    context, and dropped with the identities they match.
+    """
+    matchers = context.current().trailer_matchers
+    if (trailers, org) not in matchers:
+        keywords = re.compile(f"({trailers}):", re.IGNORECASE)
+        regex = re.compile(trailer_regex(trailers, org), re.IGNORECASE)
+        matchers[trailers, org] = keywords, regex
+    return matchers[trailers, org]
+
+
+def parse_scan(args, log):
+    commit = None
+    in_message = False
+    for line in log:
+        if line.startswith(COMMIT_START):
+            if commit is not None:
+                yield commit
+            # Some formats add the commit date and parents as extra fields
+            fields = line[len(COMMIT_START) :].split(SEP)
+            commit = ScannedCommit(args, *fields)
+            in_message = True
+        elif in_message:
+            if line.endswith(MESSAGE_END):
+                line = line[: -len(MESSAGE_END)]
+                in_message = False
+            if line != "":
+                commit.message.append(line)
+        elif line != "":
+            commit.paths.append(line)
+    if commit is not None:
+        yield commit
+
+
+@register_scan("total_patches")
+def scan_total_patches(args, commit):
+    return [commit.org]
+
+
+@register_scan("internal_patches_to_org_files")
+def scan_internal_patches_to_org_files(args, commit):
+    return [commit.org] if commit.org in commit.file_owners else []
+
+
+@register_scan("external_patches_to_org_files")
+def scan_external_patches_to_org_files(args, commit):
+    return commit.file_owners - {commit.org}
+
+
+@register_scan("reviewed_patches")
+def scan_reviewed_patches(args, commit):
+    return [org for org in args.orgs if commit.has_trailer(REVIEW_TRAILERS, org)]
+
+
+@register_scan("reported_by_patches")
+def scan_reported_by_patches(args, commit):
+    return [org for org in args.orgs if commit.has_trailer(REPORT_TRAILERS, org)]
+
+
+def sample_mask(seed):
+    return int(hashlib.sha256(str(seed).encode()).hexdigest()[:8], 16)
+
+
+def sample_commits(args):
+    """
+    The commits of the --sample: each commit is selected with probability
+    args.sample, by whether the first 32 bits of its id, xor a mask drawn
+    from args.seed, fall below args.sample * 2^32. Commit ids are uniformly
+    distributed, so this is a uniform sample, the same for a given seed.
+    """
+    threshold = int(args.sample * (1 << 32))
+    mask = sample_mask(args.seed)
+    revs = iomanager.git_stream(
+        ["rev-list", "--no-merges", context.current().branch] + args.since.split()
+    )
+    return [sha for sha in revs if int(sha[:8], 16) ^ mask < threshold]
+
+
+def scan(args):
+    """
+    Gather all the selected metrics from a single `git log` over the history,
+    instead of one query per metric and organization.
+    """
+    results = {metric: Tally(args) for metric in args.metrics}
+    ctx = context.current()
+    rankings = None
+    if args.top is not None:
+        from . import topn
+
+        # Ranked in the same walk if it covers them, see topn.gather()
+        if args.previous is None or topn.resumable(args):
+            rankings = topn.Rankings(args)
+    if args.sample is None:
+        log = iomanager.git_stream(SCAN_LOG_OPTS + [ctx.branch] + args.since.split())
+        total = iomanager.count_commits(["--no-merges"] + args.since.split())
+    else:
+        sampled = sample_commits(args)
+        log = iomanager.git_stream(
+            SCAN_LOG_OPTS + ["--no-walk", "--stdin"], input="\n".join(sampled)
+        )
+        total = len(sampled)
+        if total == 0:
+            log = []  # git would show HEAD otherwise
+    with cached_path_index():
+        bar = iomanager.bar("Scanning history", total)
+        for commit in bar.iter(parse_scan(args, log)):
+            for metric in args.metrics:
+                for org in scan_registry[metric](args, commit):
+                    results[metric].add(org, commit.timestamp)
+            if rankings is not None:
+                rankings.add_commit(commit)
+    args.__dict__["rankings"] = rankings
+    return {metric: tally.result() for metric, tally in results.items()}
+
+
+def branch_masks(heads, commits):
+    """
+    Yield each of `commits`, listed in topological order, with the bitmask of
+    the `heads` it is reachable from, bit i standing for heads[i]. The mask
+    of a commit is that of its children, all listed before it, ORed
+    together, so only those of the commits yet to be listed are kept.
+    """
+    pending = {}
+    for i, head in enumerate(heads):
+        pending[head] = pending.get(head, 0) | 1 << i
+    for commit in commits:
+        mask = pending.pop(commit.sha, 0)
+        for parent in commit.parents:
+            pending[parent] = pending.get(parent, 0) | mask
+        yield commit, mask
+
+
+def scan_branches(args):
+    """
+    Like scan(), for all of args.heads at once, from a single walk of their
+    union: each commit is read and classified once, whatever the number of
+    branches it is in, and counted in the results of each of them. Returns
+    the results of each head, in order.
+    """
+    results = [{metric: Tally(args) for metric in args.metrics} for _ in args.heads]
+    since = args.since.split()
+    log = iomanager.git_stream(BRANCHES_LOG_OPTS + args.heads + since)
+    total = int(iomanager.git(["rev-list", "--count"] + args.heads + since)[0])
+    with cached_path_index():
+        commits = iomanager.bar("Scanning branches", total).iter(parse_scan(args, log))
+        for commit, mask in branch_masks(args.heads, commits):
+            if len(commit.parents) > 1:
+                continue  # Only walked for the masks, merges are not counted
+            branches = [i for i in range(len(results)) if mask >> i & 1]
+            for metric in args.metrics:
+                for org in scan_registry[metric](args, commit):
+                    for i in branches:
+                        results[i][metric].add(org, commit.timestamp)
+    return [
+        {metric: tally.result() for metric, tally in branch.items()}
+        for branch in results
+    ]
+
+
+@contextlib.contextmanager
+def cached_path_index():
+    """Load the org files of the paths known from previous runs, then save them"""
+    ctx = context.current()
+    path_cache = ctx.path_index.cache_file(iomanager.cache_dir(), ctx.repo_path)
+    ctx.path_index.load(path_cache)
+    yield
+    try:
+        ctx.path_index.save(path_cache)
+    except OSError as e:
+        iomanager.warn(f"could not save the org files cache '{path_cache}': {e}")
+
+
+def check_metrics(args):
+    for metric in args.metrics:
+        if metric not in metric_registry:
+            sys.exit(
+                f"FATAL: unknown metric '{metric}'. "
+                + "Known ones:\n"
+                + "\n".join(iomanager.all_metrics)
+            )
+
+
+def gather_stats(args):
+    check_metrics(args)
+
+    if args.store is not None:
+        from . import store
+
+        return store.gather_stats(args)
+
+    if args.shards > 1:
+        return gather_sharded(args)
+
+    if args.engine == "query" and args.jobs > 1:
+        ctx = context.current()
+        ctx.pool = ThreadPoolExecutor(max_workers=args.jobs)
+        try:
+            # Queue every per-org query upfront, metrics then consume them
+            # in order.
+            for metric in args.metrics:
+                if metric in query_registry:
+                    query_registry[metric](args)
+            return collect_stats(args)
+        except BaseException:
+            # Do not leave the queries cancelled below to later analyses
+            ctx.memo.clear()
+            raise
+        finally:
+            ctx.pool.shutdown(cancel_futures=True)
+            ctx.pool = None
+    return collect_stats(args)
+
+
+def collect_stats(args):
+    """[bins x metrics x orgs] counts, and the metric of each column"""
     total = len(args.metrics)
-    results = [list() for _ in range(args.groups)]
+    results = []
     headers = []
-    for i, metric in enumerate(args.metrics):
-        metric_fn = metric_registry[metric]
-        print(f"======= STEP {i} / {total}: {metric}")
-        this_results = metric_fn(args)
-        for i in range(args.groups):
-            results[i].append(this_results[i])
-        headers.append(metric)
-        print()
-    return results, headers
+    with profiler.hot_loop():
+        if args.engine == "scan":
+            print(f"======= SCAN: {', '.join(args.metrics)}")
+            with profiler.stage("scan"):
+                scanned = scan(args)
+            print()
+        for i, metric in enumerate(args.metrics):
+            if args.engine == "scan":
+                this_results = scanned[metric]
+            else:
+                metric_fn = metric_registry[metric]
+                print(f"======= STEP {i} / {total}: {metric}")
+                with profiler.stage(f"metric:{metric}"):
+                    this_results = metric_fn(args)
+                print()
+            results.append(this_results)
+            headers.append(metric)
+    return np.stack(results, axis=1), headers
+
+
+def gather_branches(args):
+    """
+    [bins x metrics x orgs] counts of each of args.branches, and the metric of
+    each column, see scan_branches()
+    """
+    check_metrics(args)
+    print(f"======= SCAN: {', '.join(args.metrics)} on {', '.join(args.branches)}")
+    with profiler.hot_loop(), profiler.stage("scan"):
+        scanned = scan_branches(args)
+    print()
+    counts = [
+        np.stack([branch[metric] for metric in args.metrics], axis=1)
+        for branch in scanned
+    ]
+    return counts, list(args.metrics)
+
+
+def shard_ranges(args):
+    """
+    Split the history into up to args.shards contiguous ranges of whole bins,
+    as git options limiting the commit date. The first range keeps the
+    original lower limit, and the last one has no upper limit.
+    """
+    edges = bin_edges(args).tolist()
+    shards = min(args.shards, args.bins)
+    starts = [edges[args.bins * i // shards - 1] for i in range(1, shards)]
+    lower = [args.since] + [f"--since=@{start}" for start in starts]
+    upper = [f" --until=@{start - 1}" for start in starts] + [""]
+    return [since + until for since, until in zip(lower, upper)]
+
+
+def init_shard(config):
+    # The parent reports the progress of all the shards instead
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    iomanager.restore_config(config)
+    profiler.ACTIVE = None
+
+
+def gather_shard(args, since):
+    """
+    The stats of a shard, and the summaries of its rankings with --top. Those
+    of the results to be updated are only resumed once, by the parent.
+    """
+    args = copy.copy(args)
+    args.since = since
+    args.shards = 1
+    args.previous = None
+    counts, headers = gather_stats(args)
+    if args.top is None:
+        return counts, headers, None
+    from . import topn
+
+    return counts, headers, topn.rank(args).summaries
+
+
+def gather_sharded(args):
+    """
+    Gather the stats of each range of shard_ranges() in its own process, and
+    add them up. Commits are binned the same way in every shard, so the sum
+    is the same as a single pass, clamping included. As git stops walking a
+    line of history at the first commit older than --since, this assumes
+    commit dates do not go backwards across the shard edges, which --since
+    already assumes for the whole history.
+
+    With --top, the shards also rank the contributors of their ranges, and
+    their summaries are merged into args.rankings, see topn.rank(). Unless
+    the whole window has to be ranked again for --update, which is left to
+    topn.rank().
+    """
+    ranges = shard_ranges(args)
+    shard_args = copy.copy(args)
+    shard_args.jobs = max(1, args.jobs // len(ranges))
+    rankings = None
+    if args.top is not None:
+        from . import topn
+
+        if args.previous is None or topn.resumable(args):
+            rankings = topn.Rankings(args)
+        else:
+            shard_args.top = None
+    pool = ProcessPoolExecutor(
+        max_workers=len(ranges),
+        initializer=init_shard,
+        initargs=(iomanager.config_state(),),
+    )
+    with pool:
+        shards = [pool.submit(gather_shard, shard_args, since) for since in ranges]
+        bar = iomanager.bar(f"Gathering stats in {len(ranges)} shards", len(shards))
+        counts = None
+        for shard in shards:
+            shard_counts, headers, summaries = shard.result()
+            counts = shard_counts if counts is None else counts + shard_counts
+            if rankings is not None:
+                rankings.merge(summaries)
+            bar.next()
+        bar.finish()
+    if rankings is not None:
+        args.__dict__["rankings"] = rankings
+    return counts, headers
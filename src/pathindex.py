@@ -0,0 +1,123 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+
+def glob_to_regex(glob):
+    """
+    Translate a git pathspec glob into a regex. Without the ':(glob)' magic,
+    git matches pathspecs with `wildmatch()` and no WM_PATHNAME flag: '*'
+    and '?' also match '/', and the glob must match the whole path.
+    """
+    regex = []
+    i = 0
+    while i < len(glob):
+        c = glob[i]
+        i += 1
+        if c == "*":
+            regex.append(".*")
+        elif c == "?":
+            regex.append(".")
+        elif c == "\\" and i < len(glob):
+            regex.append(re.escape(glob[i]))
+            i += 1
+        elif c == "[":
+            end = i
+            if end < len(glob) and glob[end] in "!^":
+                end += 1
+            if end < len(glob) and glob[end] == "]":
+                end += 1
+            while end < len(glob) and glob[end] != "]":
+                end += 2 if glob[end] == "\\" else 1
+            if end >= len(glob):
+                regex.append(re.escape(c))
+                continue
+            body = glob[i:end]
+            i = end + 1
+            negate = body[0] in "!^"
+            if negate:
+                body = body[1:]
+            for char in "[&~|":
+                body = body.replace(char, f"\\{char}")
+            regex.append(f"[{'^' if negate else ''}{body}]")
+        else:
+            regex.append(re.escape(c))
+    return "".join(regex)
+
+
+class PathIndex:
+    """
+    Classifies paths as files of zero or more organizations, given the
+    pathspec globs of each org. All globs are compiled into a single regex
+    with one optional lookahead group per org, so that a path is classified
+    for every org in one match, and each distinct path is only matched once.
+    The path -> orgs mapping can be saved and loaded back, to skip even that
+    on later runs.
+    """
+
+    def __init__(self, org_globs):
+        self.orgs = list(org_globs)
+        self.key = hashlib.sha256(
+            json.dumps(org_globs, sort_keys=True).encode()
+        ).hexdigest()
+        # Like `git log --` without paths, no globs means the whole tree
+        groups = [
+            f"(?:(?=(?:{'|'.join(map(glob_to_regex, globs or ['*']))})\\Z)(?P<org{i}>))?"
+            for i, globs in enumerate(org_globs.values())
+        ]
+        self.regex = re.compile("".join(groups), re.DOTALL)
+        self.owners = {}
+        self.loaded = 0
+
+    def match(self, path):
+        groups = self.regex.match(path).groups()
+        return frozenset(org for org, g in zip(self.orgs, groups) if g is not None)
+
+    def lookup(self, path):
+        if path not in self.owners:
+            self.owners[path] = self.match(path)
+        return self.owners[path]
+
+    def classify(self, paths):
+        """The orgs owning any of these paths"""
+        owners = set()
+        for path in paths:
+            owners |= self.lookup(path)
+        return owners
+
+    def cache_file(self, cache_dir, repo):
+        repo_id = hashlib.sha256(os.path.abspath(repo).encode()).hexdigest()
+        return os.path.join(cache_dir, f"paths-{repo_id[:16]}.json")
+
+    def load(self, filename):
+        try:
+            with open(filename, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("key") != self.key:
+            return  # The org files changed
+        for path, orgs in data["paths"].items():
+            self.owners.setdefault(path, frozenset(orgs))
+        self.loaded = len(self.owners)
+
+    def save(self, filename):
+        if len(self.owners) == self.loaded:
+            return  # Nothing new
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        data = {
+            "key": self.key,
+            "paths": {path: sorted(orgs) for path, orgs in self.owners.items()},
+        }
+        tmp = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, filename)
+        self.loaded = len(self.owners)
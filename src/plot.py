@@ -3,29 +3,47 @@
 # SPDX-License-Identifier: BSD-3-Clause
 #
 
-import sys
-import matplotlib.pyplot as plt
 import datetime
-
-from itertools import accumulate
+import hashlib
+import json
+import matplotlib
+import numpy as np
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 BASE_FONTSIZE = 16
 
+# Charts are drawn on their own figures, with the Agg canvas and no pyplot
+# state, so that they can be rendered by any process and always come out the
+# same for the same data.
+RC_PARAMS = {"font.size": BASE_FONTSIZE}
+FIGSIZE = (16, 9)
+
+# The charts rendered in a --dir are listed in this file of the directory,
+# with the key of what they were drawn from, see chart_key(). Charts whose key
+# has not changed since are not rendered again. Bump CACHE_VERSION when the
+# drawing code changes.
+MANIFEST = ".ctracker-plots.json"
+CACHE_VERSION = 1
+
 
 def mkagg(arr):
-    return [*accumulate(arr)]
+    return np.cumsum(arr).tolist()
 
 
-def init_fig():
-    plt.clf()
-    plt.figure(figsize=(16, 9))
-    plt.rcParams.update({"font.size": BASE_FONTSIZE})
+def new_fig():
+    fig = Figure(figsize=FIGSIZE)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots()
 
 
-def timeframe_str(obj):
-    times = list(map(datetime.date.fromisoformat, obj["timestamps"]))
+def timeframe_str(results):
+    times = list(map(datetime.date.fromisoformat, results.timestamps))
     start_year = times[0].year
-    last_year = (times[-1] + datetime.timedelta(days=obj["time_period_days"])).year
+    last_year = (times[-1] + datetime.timedelta(days=results.period)).year
     if start_year == last_year:
         timeframe = str(start_year)
     else:
@@ -33,10 +51,53 @@ def timeframe_str(obj):
     return timeframe
 
 
-def save(filename):
-    plt.tight_layout()
-    plt.savefig(filename, format="png")
-    print(f"saved '{filename}'")
+def save(fig, filename):
+    fig.tight_layout()
+    fig.savefig(filename, format="png")
+
+
+def render(chart):
+    """Render a chart, given as a drawing function and its arguments"""
+    draw, kwargs = chart
+    with matplotlib.rc_context(RC_PARAMS):
+        fig, ax = new_fig()
+        draw(ax, **kwargs)
+        save(fig, kwargs["filename"])
+    return kwargs["filename"]
+
+
+def chart_key(chart):
+    """
+    A hash of everything a chart is drawn from: its drawing function and
+    arguments but the file name, series and titles included, and the plot
+    settings.
+    """
+    draw, kwargs = chart
+    inputs = {k: v for k, v in kwargs.items() if k != "filename"}
+    data = json.dumps(
+        [CACHE_VERSION, matplotlib.__version__, RC_PARAMS, FIGSIZE, draw.__name__]
+        + [inputs],
+        sort_keys=True,
+        default=lambda v: np.asarray(v).tolist(),
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def load_manifest(directory):
+    """The key of each chart rendered in `directory`, by file name"""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(directory, manifest):
+    filename = os.path.join(directory, MANIFEST)
+    tmp = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp, filename)
 
 
 def review_index(reviewed_patches, submitted_patches):
@@ -46,50 +107,47 @@ def review_index(reviewed_patches, submitted_patches):
     return reviewed_patches / total
 
 
-def mk_review_index_plot(args, obj):
+def draw_review_index(ax, filename, title, orgs, yaxis, highlight):
+    total_orgs = len(orgs)
+    xaxis = range(total_orgs)
+    colors = ["#325ea8" if o not in highlight else "#a88c32" for o in orgs]
+
+    ax.hlines(y=0.5, xmin=-1, xmax=total_orgs, colors="red", lw=4, linestyles="--")
+    ax.bar(xaxis, yaxis, color=colors)
+    ax.set_xticks(xaxis, orgs, fontsize=BASE_FONTSIZE, rotation=60)
+    ax.set_ylim([0, 1])
+    ax.set_title(title, fontsize=BASE_FONTSIZE * 1.2)
+
+
+def review_index_chart(args, results):
     if (
-        "reviewed_patches" not in obj["metrics"]
-        or "total_patches" not in obj["metrics"]
+        "reviewed_patches" not in results.metrics
+        or "total_patches" not in results.metrics
     ):
         print("Skipping review-index plot")
-        return
-
-    init_fig()
-    total_orgs = len(obj["orgs"])
-    xaxis = range(total_orgs)
+        return None
 
-    reviewed_patches = obj["data"]["reviewed_patches"]
-    total_patches = obj["data"]["total_patches"]
+    reviewed_patches = results.column("reviewed_patches").sum(0).tolist()
+    total_patches = results.column("total_patches").sum(0).tolist()
 
     yaxis = [
-        review_index(
-            sum(reviewed_patches[time][org] for time in obj["timestamps"]),
-            sum(total_patches[time][org] for time in obj["timestamps"]),
-        )
-        for org in obj["orgs"]
+        review_index(reviewed, total)
+        for reviewed, total in zip(reviewed_patches, total_patches)
     ]
 
-    data = sorted(zip(yaxis, obj["orgs"]), key=lambda t: t[0])
-    yaxis = [t[0] for t in data]
-    orgs = [t[1] for t in data]
-    colors = ["#325ea8" if o not in args.highlight else "#a88c32" for o in orgs]
-
-    plt.hlines(y=0.5, xmin=-1, xmax=total_orgs, colors="red", lw=4, linestyles="--")
-    plt.bar(xaxis, yaxis, color=colors)
-    plt.xticks(xaxis, orgs, fontsize=BASE_FONTSIZE, rotation=60)
-    ax = plt.gca()
-    ax.set_ylim([0, 1])
-
-    timeframe = timeframe_str(obj)
-    plt.title(
-        f"Ratio of reviews over total patches: {obj['repo']} repo {timeframe}",
-        fontsize=BASE_FONTSIZE * 1.2,
+    data = sorted(zip(yaxis, results.orgs), key=lambda t: t[0])
+    timeframe = timeframe_str(results)
+    return draw_review_index, dict(
+        filename=f"{args.dir}/review_ratio_{results.repo}.png",
+        title=f"Ratio of reviews over total patches: {results.repo} repo {timeframe}",
+        orgs=[t[1] for t in data],
+        yaxis=[t[0] for t in data],
+        highlight=list(args.highlight),
     )
-    save(f"{args.dir}/review_ratio_{obj['repo']}.png")
 
 
-def mk_derived_plots(args, obj):
-    mk_review_index_plot(args, obj)
+def derived_charts(args, results):
+    return [chart for chart in [review_index_chart(args, results)] if chart]
 
 
 def ordinal(num):
@@ -98,10 +156,10 @@ def ordinal(num):
     return f"{num:2}{suffix}"
 
 
-def get_std_xaxis(obj):
+def get_std_xaxis(results):
     xaxis = []
-    for date in map(datetime.date.fromisoformat, obj["timestamps"]):
-        end_date = date + datetime.timedelta(days=obj["time_period_days"])
+    for date in map(datetime.date.fromisoformat, results.timestamps):
+        end_date = date + datetime.timedelta(days=results.period)
         date, end_date = str(date), str(end_date)
         if date[:4] != end_date[:4]:
             x = f"{date[:4]} - {end_date[:4]}"
@@ -113,78 +171,109 @@ def get_std_xaxis(obj):
     return xaxis
 
 
-def mkplots(args, obj, pretty_headers):
-    xaxis = get_std_xaxis(obj)
-    timeframe = timeframe_str(obj)
+def draw_metric(ax, filename, title, xaxis, orgs, column, highlight):
+    current_y_values = []
+    for y_id, org in enumerate(orgs):
+        yaxis = mkagg(column[:, y_id])
+        current_y_values.append((yaxis[-1], y_id, org))
+        if org in highlight:
+            ax.plot(
+                xaxis,
+                yaxis,
+                "-o",
+                color="orange",
+                linewidth=14,
+                alpha=0.4,
+                label=org,
+            )
+        else:
+            ax.plot(xaxis, yaxis, "-o", label=org)
+
+    ax.set_title(title, fontsize=BASE_FONTSIZE * 1.2)
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Accumulated number of patches")
+    for label in ax.get_xticklabels():
+        label.set_fontsize(BASE_FONTSIZE * 0.8)
+
+    current_y_values = sorted(current_y_values, key=lambda e: e[0], reverse=True)
+    order = [e[1] for e in current_y_values]
+
+    # Order the legend by latest size
+    handles, labels = ax.get_legend_handles_labels()
+    ax.legend(
+        [handles[i] for i in order],
+        [f"{ordinal(pos+1)} {labels[i]}" for pos, i in enumerate(order)],
+        fontsize=BASE_FONTSIZE,
+        loc="upper left",
+    )
+
+    # Annotate lines
+    # for i, element in enumerate(current_y_values):
+    #    ax.text(10.2, i, element[2], horizontalalignment='left', color='black')
+
+
+def all_charts(args, results, pretty_headers):
+    """The charts of the results, to be drawn with render()"""
+    xaxis = get_std_xaxis(results)
+    timeframe = timeframe_str(results)
+    headers = list(results.metrics)
+    pretty_headers = list(pretty_headers)
+    columns = [results.column(header) for header in headers]
 
     if (
-        "internal_patches_to_org_files" not in obj["metrics"]
-        or "total_patches" not in obj["metrics"]
+        "internal_patches_to_org_files" not in results.metrics
+        or "total_patches" not in results.metrics
     ):
         print("Skipping 'org patches to non org files' plot")
     else:
-        header = "internal_patches_to_non_org_files"
-        pretty_header = "Patches to non-org files"
-        obj["metrics"].append(header)
-        pretty_headers.append(pretty_header)
-
-        total_patches = obj["data"]["total_patches"]
-        internal_patches_to_org_files = obj["data"]["internal_patches_to_org_files"]
-
-        obj["data"][header] = {
-            time: {
-                org: (
-                    total_patches[time][org] - internal_patches_to_org_files[time][org]
-                )
-                for org in obj["orgs"]
-            }
-            for time in obj["timestamps"]
-        }
-
-    for header_id, header in enumerate(obj["metrics"]):
-        init_fig()
-        current_y_values = []
-        for y_id, org in enumerate(obj["orgs"]):
-            yaxis = [obj["data"][header][time][org] for time in obj["timestamps"]]
-            yaxis = mkagg(yaxis)
-            current_y_values.append((yaxis[-1], y_id, org))
-            if org in args.highlight:
-                plt.plot(
-                    xaxis,
-                    yaxis,
-                    "-o",
-                    color="orange",
-                    linewidth=14,
-                    alpha=0.4,
-                    label=org,
-                )
-            else:
-                plt.plot(xaxis, yaxis, "-o", label=org)
-
-        plt.title(
-            f"{pretty_headers[header_id]}: {obj['repo']} repo {timeframe}",
-            fontsize=BASE_FONTSIZE * 1.2,
-        )
-        plt.xlabel("Time")
-        plt.ylabel("Accumulated number of patches")
-        plt.xticks(fontsize=BASE_FONTSIZE * 0.8)
-
-        current_y_values = sorted(current_y_values, key=lambda e: e[0], reverse=True)
-        order = [e[1] for e in current_y_values]
-
-        # Order the legend by latest size
-        handles, labels = plt.gca().get_legend_handles_labels()
-        plt.legend(
-            [handles[i] for i in order],
-            [f"{ordinal(pos+1)} {labels[i]}" for pos, i in enumerate(order)],
-            fontsize=BASE_FONTSIZE,
-            loc="upper left",
+        headers.append("internal_patches_to_non_org_files")
+        pretty_headers.append("Patches to non-org files")
+        columns.append(
+            results.column("total_patches")
+            - results.column("internal_patches_to_org_files")
         )
 
-        # Annotate lines
-        # for i, element in enumerate(current_y_values):
-        #    plt.text(10.2, i, element[2], horizontalalignment='left', color='black')
-
-        save(f"{args.dir}/{header}_{obj['repo']}.png")
-
-    mk_derived_plots(args, obj)
+    charts = [
+        (
+            draw_metric,
+            dict(
+                filename=f"{args.dir}/{header}_{results.repo}.png",
+                title=f"{pretty_headers[header_id]}: {results.repo} repo {timeframe}",
+                xaxis=xaxis,
+                orgs=list(results.orgs),
+                column=np.asarray(columns[header_id]),
+                highlight=list(args.highlight),
+            ),
+        )
+        for header_id, header in enumerate(headers)
+    ]
+    return charts + derived_charts(args, results)
+
+
+def mkplots(args, results, pretty_headers):
+    """
+    Render the charts of the results in args.dir, but those already there
+    and drawn from the same data, according to the manifest of the directory.
+    """
+    charts = all_charts(args, results, pretty_headers)
+    manifest = load_manifest(args.dir)
+    keys = {}
+    stale = []
+    for chart in charts:
+        filename = chart[1]["filename"]
+        name = os.path.basename(filename)
+        keys[name] = chart_key(chart)
+        if manifest.get(name) != keys[name] or not os.path.exists(filename):
+            stale.append(chart)
+
+    workers = min(args.jobs, len(stale))
+    if workers <= 1:
+        saved = map(render, stale)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            saved = list(pool.map(render, stale))
+    for filename in saved:
+        print(f"saved '{filename}'")
+    manifest.update(keys)
+    save_manifest(args.dir, manifest)
+    print(f"plots: {len(stale)} rendered, {len(charts) - len(stale)} reused")
@@ -0,0 +1,191 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+`ctracker prepare`: make sure the repo has a commit-graph with changed-path
+Bloom filters covering the branch to be analyzed, so that history walks,
+and the per-org pathspec queries in particular, are cheaper.
+"""
+
+import argparse
+import bisect
+import os
+import struct
+import sys
+import time
+
+from . import context, iomanager
+
+GRAPH_SIGNATURE = b"CGPH"
+HASH_LENGTHS = {1: 20, 2: 32}
+
+
+def read_graph(filename):
+    """The sorted commit ids of a commit-graph file, and its chunk ids"""
+    with open(filename, "rb") as f:
+        data = f.read()
+    signature, _, hash_version, nchunks, _ = struct.unpack(">4sBBBB", data[:8])
+    if signature != GRAPH_SIGNATURE or hash_version not in HASH_LENGTHS:
+        raise ValueError(f"'{filename}' is not a commit-graph")
+    chunks = {}
+    for i in range(nchunks + 1):
+        chunk_id, offset = struct.unpack(">4sQ", data[8 + 12 * i : 20 + 12 * i])
+        chunks[chunk_id] = offset
+    fanout = chunks[b"OIDF"]
+    ncommits = struct.unpack(">I", data[fanout + 255 * 4 : fanout + 256 * 4])[0]
+    hash_len = HASH_LENGTHS[hash_version]
+    oids = data[chunks[b"OIDL"] : chunks[b"OIDL"] + ncommits * hash_len]
+    commits = [oids[i : i + hash_len] for i in range(0, len(oids), hash_len)]
+    return commits, set(chunks)
+
+
+def graph_files(object_dir):
+    info = os.path.join(object_dir, "info")
+    files = []
+    if os.path.isfile(os.path.join(info, "commit-graph")):
+        files.append(os.path.join(info, "commit-graph"))
+    chain = os.path.join(info, "commit-graphs", "commit-graph-chain")
+    if os.path.isfile(chain):
+        with open(chain) as f:
+            for graph_hash in f.read().split():
+                files.append(
+                    os.path.join(info, "commit-graphs", f"graph-{graph_hash}.graph")
+                )
+    return files
+
+
+def graph_status(object_dir, head):
+    """Whether the commit-graph of `object_dir` is usable to analyze `head`"""
+    files = graph_files(object_dir)
+    if not files:
+        return "missing"
+    head = bytes.fromhex(head)
+    has_head = False
+    for filename in files:
+        try:
+            commits, chunks = read_graph(filename)
+        except (OSError, ValueError, KeyError, struct.error):
+            return "unreadable"
+        if b"BIDX" not in chunks or b"BDAT" not in chunks:
+            return "no Bloom filters"
+        i = bisect.bisect_left(commits, head)
+        has_head = has_head or (i < len(commits) and commits[i] == head)
+    return "up to date" if has_head else "stale"
+
+
+def repo_object_dir():
+    path = iomanager.git(["rev-parse", "--git-path", "objects"])[0]
+    return os.path.normpath(os.path.join(context.current().repo_path, path))
+
+
+def timed(cmd):
+    start = time.monotonic()
+    iomanager.git(cmd)
+    return time.monotonic() - start
+
+
+def time_queries(args):
+    """Time a plain history walk, and the pathspec query of each org"""
+    query = ["rev-list", "--count", "--no-merges", args.head]
+    query.append(f"--since={args.since}.years.ago")
+    timings = [("history", timed(query))]
+    for org, globs in context.current().org_file_globs.items():
+        timings.append((f"{org} files", timed(query + ["--"] + globs)))
+    return timings
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="ctracker prepare",
+        description="Build or refresh the commit-graph of a repo, with "
+        + "changed-path Bloom filters, to speed up later analyses.",
+    )
+    parser.add_argument(
+        "-r", "--repo", help="path to the git repo to be prepared. Default to $PWD"
+    )
+    parser.add_argument(
+        "-b",
+        "--branch",
+        default="HEAD",
+        help="git branch to be analized. Default to HEAD",
+    )
+    parser.add_argument(
+        "--config",
+        help="Config file to use. Its org files are used to time pathspec "
+        + "queries before and after.",
+    )
+    parser.add_argument(
+        "-s",
+        "--since",
+        default="10",
+        help="Since when the queries are timed (in years)",
+    )
+    parser.add_argument(
+        "--object-dir",
+        metavar="DIR",
+        help="Write the commit-graph to this directory instead of the repo, "
+        + "which is left untouched. Later runs need the same --object-dir.",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only report whether the commit-graph is up to date.",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Rewrite the commit-graph anyway."
+    )
+    args = parser.parse_args(argv)
+    args.orgs = None
+    args.from_json = None
+    return args
+
+
+def main(argv):
+    from tabulate import tabulate
+
+    args = parse_args(argv)
+    repo = args.repo if args.repo is not None else os.getcwd()
+    context.current().repo_path = repo
+    if args.object_dir is not None:
+        args.object_dir = os.path.abspath(args.object_dir)
+        os.makedirs(args.object_dir, exist_ok=True)
+        iomanager.use_object_dir(args.object_dir)
+        object_dir = args.object_dir
+    else:
+        object_dir = repo_object_dir()
+    if args.config is not None:
+        iomanager.load_config(args)
+    args.head = iomanager.resolve_commit(args.branch)
+
+    status = graph_status(object_dir, args.head)
+    print(f"commit-graph in '{object_dir}': {status}")
+    if args.check:
+        sys.exit(0 if status == "up to date" else 1)
+    if status == "up to date" and not args.force:
+        return
+
+    print("Timing git queries...")
+    before = time_queries(args)
+    print("Writing the commit-graph...")
+    start = time.monotonic()
+    iomanager.git(
+        ["commit-graph", "write", "--reachable", "--changed-paths"]
+        + ["--object-dir", object_dir]
+    )
+    write_time = time.monotonic() - start
+    print("Timing git queries again...")
+    after = time_queries(args)
+
+    print(f"========= SUMMARY (commit-graph written in {write_time:.2f}s)")
+    print(
+        tabulate(
+            [
+                [name, f"{t0:.2f}s", f"{t1:.2f}s", f"{t0 / max(t1, 1e-6):.1f}x"]
+                for (name, t0), (_, t1) in zip(before, after)
+            ],
+            headers=["query", "before", "after", "speedup"],
+            tablefmt="simple",
+        )
+    )
@@ -0,0 +1,126 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import contextlib
+import json
+import resource
+import sys
+import threading
+import time
+
+# The profiler of this run, only set with --profile
+ACTIVE = None
+
+
+class Profiler:
+    """
+    Records what each stage of a run costs: wall and CPU time, the git
+    commands it ran and how much output they produced, and the peak memory
+    reached by its end. Git costs are process-wide counters, so with --jobs a
+    stage includes the queries that ran in the background meanwhile.
+    """
+
+    def __init__(self, report_file, cprofile_file=None):
+        self.report_file = report_file
+        self.cprofile_file = cprofile_file
+        self.lock = threading.Lock()
+        self.git_calls = 0
+        self.git_bytes = 0
+        self.git_lines = 0
+        self.stages = []
+        self.start = self.snapshot()
+
+    def add_git_call(self):
+        with self.lock:
+            self.git_calls += 1
+
+    def add_git_output(self, nbytes, nlines):
+        with self.lock:
+            self.git_bytes += nbytes
+            self.git_lines += nlines
+
+    def snapshot(self):
+        with self.lock:
+            return (
+                time.perf_counter(),
+                time.process_time(),
+                self.git_calls,
+                self.git_bytes,
+                self.git_lines,
+            )
+
+    def measure(self, name, start):
+        end = self.snapshot()
+        wall, cpu, calls, nbytes, lines = (e - s for e, s in zip(end, start))
+        return {
+            "name": name,
+            "wall_secs": round(wall, 6),
+            "cpu_secs": round(cpu, 6),
+            "git_calls": calls,
+            "git_bytes": nbytes,
+            "git_lines": lines,
+            "lines_per_sec": round(lines / wall, 1) if wall > 0 else 0,
+            # KiB on Linux
+            "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "git_peak_rss_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        }
+
+    def report(self):
+        return {
+            "command": sys.argv,
+            "total": self.measure("total", self.start),
+            "stages": self.stages,
+            "cprofile": self.cprofile_file,
+        }
+
+    def save(self):
+        with open(self.report_file, "w") as f:
+            json.dump(self.report(), f, indent=4)
+
+
+def start(report_file, cprofile_file=None):
+    global ACTIVE
+    ACTIVE = Profiler(report_file, cprofile_file)
+
+
+def finish():
+    global ACTIVE
+    if ACTIVE is not None:
+        ACTIVE.save()
+        print(f"saved profile '{ACTIVE.report_file}'", file=sys.stderr)
+        ACTIVE = None
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Record the costs of the code in the `with` block as a stage"""
+    if ACTIVE is None:
+        yield
+        return
+    start = ACTIVE.snapshot()
+    try:
+        yield
+    finally:
+        ACTIVE.stages.append(ACTIVE.measure(name, start))
+
+
+@contextlib.contextmanager
+def hot_loop():
+    """
+    Run the `with` block under cProfile, if requested, and dump its stats.
+    Only the calling thread is profiled.
+    """
+    if ACTIVE is None or ACTIVE.cprofile_file is None:
+        yield
+        return
+    import cProfile
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(ACTIVE.cprofile_file)
@@ -0,0 +1,247 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import datetime
+import math
+import numpy as np
+
+# The rankings of the top section
+KINDS = ("authors", "reviewers")
+
+
+def bin_edges(args):
+    """The starting timestamp of each bin but the first one"""
+    period_secs = args.period * 24 * 60 * 60
+    return args.initial_timestamp + period_secs * np.arange(1, args.bins)
+
+
+def bin_nums(args, timestamps):
+    """
+    The bin of each timestamp in the batch: the number of whole periods since
+    the initial timestamp, clamped to the first and last bins.
+    """
+    return np.digitize(np.asarray(timestamps, dtype=np.int64), bin_edges(args))
+
+
+# Of the intervals of --sample estimates
+CONFIDENCE = 0.95
+Z_SCORE = 1.96
+
+
+def sample_estimates(counts, rate):
+    """
+    Estimates of the counts of all the commits from the `counts` of a sample
+    of `rate` of them, and their confidence intervals, as (estimates, low,
+    high) integer arrays.
+
+    A count X of the sample is binomial of parameters n, the unknown count,
+    and p, the rate: n is estimated as X / p, with a normal interval of half
+    width z * sqrt(X * (1 - p)) / p. When X is 0, the normal approximation
+    does not hold: the interval is [0, N], N being the largest count for
+    which a sample of 0 still has 1 - CONFIDENCE chances or more.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    estimates = np.rint(counts / rate)
+    half = Z_SCORE * np.sqrt(counts * (1 - rate)) / rate
+    low = np.maximum(counts, np.floor(estimates - half))
+    high = np.ceil(estimates + half)
+    if rate < 1:
+        high[counts == 0] = math.floor(math.log(1 - CONFIDENCE) / math.log(1 - rate))
+    return estimates.astype(np.int64), low.astype(np.int64), high.astype(np.int64)
+
+
+def fold(groups, raw):
+    """
+    Merge the bins past the last group into it, as it holds everything up to
+    today.
+    """
+    return np.concatenate([raw[: groups - 1], raw[groups - 1 :].sum(0, keepdims=True)])
+
+
+class Tally:
+    """
+    Per-bin counts of events by org. Events are queued and their timestamps
+    binned in batches, rather than one by one. Events from orgs not in the
+    list are counted in an extra last column.
+    """
+
+    BATCH_SIZE = 1 << 16
+
+    def __init__(self, args, orgs=None):
+        self.args = args
+        self.orgs = {
+            org: i for i, org in enumerate(args.orgs if orgs is None else orgs)
+        }
+        self.counts = np.zeros((args.bins, len(self.orgs) + 1), dtype=np.int64)
+        self.timestamps = []
+        self.org_ids = []
+
+    def add(self, org, timestamp):
+        self.org_ids.append(self.orgs.get(org, len(self.orgs)))
+        self.timestamps.append(int(timestamp))
+        if len(self.timestamps) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if len(self.timestamps) == 0:
+            return
+        columns = self.counts.shape[1]
+        cells = bin_nums(self.args, self.timestamps) * columns + self.org_ids
+        self.counts += np.bincount(cells, minlength=self.counts.size).reshape(
+            self.counts.shape
+        )
+        self.timestamps = []
+        self.org_ids = []
+
+    def result(self, untracked=False):
+        """[bins x orgs] counts, plus the untracked column if requested"""
+        self.flush()
+        return self.counts if untracked else self.counts[:, :-1]
+
+
+def by_metric(counts, timestamps, metrics, orgs):
+    """[groups x metrics x orgs] counts as [metric][timestamp][org] dicts"""
+    return {
+        metric: {
+            timestamp: dict(zip(orgs, row))
+            for timestamp, row in zip(timestamps, counts[:, metric_id].tolist())
+        }
+        for metric_id, metric in enumerate(metrics)
+    }
+
+
+class Results:
+    """
+    The counts of each metric by time group and org, as a dense
+    [groups x metrics x orgs] integer array, together with what is needed to
+    label them. The json files are a serialization of it, see json_parser.
+    """
+
+    def __init__(
+        self,
+        repo,
+        period,
+        timestamps,
+        metrics,
+        orgs,
+        counts,
+        gen_time,
+        scan=None,
+        top=None,
+        sample=None,
+    ):
+        """
+        `counts` is either the array, or a function loading the [groups x orgs]
+        column of a given metric, in which case columns are only loaded as
+        they are used. The function may have a close() method, called by
+        close().
+        """
+        self.repo = repo
+        self.period = period
+        self.timestamps = timestamps
+        self.metrics = list(metrics)
+        self.orgs = list(orgs)
+        self.gen_time = gen_time
+        # What `--update` needs, see from_args()
+        self.scan = scan
+        # The top contributors with --top, see topn.gather()
+        self.top = top
+        # The rate, seed and confidence intervals of --sample estimates, see
+        # from_args()
+        self.sample = sample
+        self._counts = None
+        self._columns = {}
+        self._load_column = None
+        if callable(counts):
+            self._load_column = counts
+        else:
+            self._counts = counts
+
+    @property
+    def counts(self):
+        if self._counts is None:
+            columns = [self.column(metric) for metric in self.metrics]
+            self._counts = np.stack(columns, axis=1)
+        return self._counts
+
+    @classmethod
+    def from_args(cls, args, raw, headers, top=None):
+        """
+        Build the results of an analysis from the [bins x metrics x orgs]
+        counts gathered by metrics.gather_stats(), and the rankings of
+        topn.gather() if any.
+
+        The counts of a --sample are scaled up to estimates, and their
+        intervals kept in `sample`, with [metric][timestamp][org] bounds.
+        """
+        raw = np.array(raw, dtype=np.int64)
+        if args.previous is not None:
+            for header_id, header in enumerate(headers):
+                previous = np.array(
+                    args.previous["scan"]["raw"][header], dtype=np.int64
+                )
+                raw[: len(previous), header_id] += previous
+        initial = datetime.date.fromtimestamp(args.initial_timestamp)
+        timestamps = [
+            str(initial + datetime.timedelta(days=(args.period * i)))
+            for i in range(args.groups)
+        ]
+        if top is not None:
+            top = dict(
+                top, **{kind: dict(zip(timestamps, top[kind])) for kind in KINDS}
+            )
+        counts = fold(args.groups, raw)
+        scan = {
+            "branch": args.branch,
+            "head": args.head,
+            "initial_timestamp": args.initial_timestamp,
+            "raw": raw,
+        }
+        sample = None
+        if args.sample is not None:
+            counts, low, high = sample_estimates(counts, args.sample)
+            scan = None  # Estimates cannot be updated
+            sample = {
+                "rate": args.sample,
+                "seed": args.seed,
+                "confidence": CONFIDENCE,
+                "low": by_metric(low, timestamps, headers, args.orgs),
+                "high": by_metric(high, timestamps, headers, args.orgs),
+            }
+        return cls(
+            args.repo,
+            args.period,
+            timestamps,
+            headers,
+            args.orgs,
+            counts,
+            datetime.date.today(),
+            scan,
+            top,
+            sample,
+        )
+
+    def close(self):
+        """
+        Release the file the columns are loaded from, if any. Columns not
+        loaded yet cannot be anymore.
+        """
+        close = getattr(self._load_column, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def column(self, metric):
+        """[groups x orgs] counts of a metric"""
+        if self._counts is not None:
+            return self._counts[:, self.metrics.index(metric), :]
+        if metric not in self._columns:
+            self._columns[metric] = self._load_column(metric)
+        return self._columns[metric]
@@ -0,0 +1,283 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+`ctracker serve`: analyze a repo once, then keep the results warm in memory
+and serve them over HTTP. The branch is polled for new commits, which are
+folded into the results like `--update` does, and the results and plots are
+rendered ahead of the requests, so that these are answered from memory.
+
+    /results.json       the results, in the json format of --format json
+    /plots/             the list of plots
+    /plots/<name>.png   a plot, as --format plot draws it
+    /status             the analyzed head, and when it was last refreshed
+
+Responses have an ETag, and a request with a matching If-None-Match gets an
+empty "304 Not Modified" instead.
+"""
+
+import argparse
+import copy
+import datetime
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import urllib.parse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import context, iomanager, json_parser, metrics, topn
+from .results import Results
+
+# Options of ctracker making no sense for a service
+EXCLUDED_OPTIONS = (
+    "-f",
+    "--format",
+    "-u",
+    "--update",
+    "--from-json",
+    "--manifest",
+    "--sample",
+)
+
+
+def etag(body):
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+class Snapshot:
+    """The responses for the results of a given head, ready to be sent"""
+
+    def __init__(self, head, json_obj, plots):
+        self.head = head
+        self.json_obj = json_obj
+        self.body = json.dumps(json_obj, default=str).encode()
+        self.etag = etag(self.body)
+        self.plots = {name: (png, etag(png)) for name, png in plots.items()}
+        self.updated = datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class Service:
+    """
+    The results of the branch of a repo, refreshed by refresh(). `args` are
+    parsed by iomanager.parse_args(), and used as is by every analysis.
+    """
+
+    def __init__(self, args, repo_path, plots=True):
+        self.args = args
+        self.repo_path = repo_path
+        self.plots = plots
+        self.snapshot = None
+        self.lock = threading.Lock()
+        # The key and png of each plot of the snapshot, see render()
+        self.charts = {}
+
+    def analyze(self, previous):
+        args = copy.copy(self.args)
+        iomanager.set_window(args, previous)
+        iomanager.select_repo(args, self.repo_path)
+        try:
+            counts, headers = metrics.gather_stats(args)
+        finally:
+            # Queries of a commit range are not asked for twice
+            metrics.clear_caches()
+        return args, Results.from_args(args, counts, headers, topn.gather(args))
+
+    def render(self, args, results):
+        """
+        The png of each plot, by file name. Those drawn from the same data
+        as in the current snapshot are not rendered again.
+        """
+        if not self.plots:
+            return {}
+        from . import plot
+
+        charts = {}
+        for draw, kwargs in plot.all_charts(
+            args, results, iomanager.pretty_names(results.metrics)
+        ):
+            name = os.path.basename(kwargs["filename"])
+            key = plot.chart_key((draw, kwargs))
+            if self.charts.get(name, (None,))[0] == key:
+                charts[name] = self.charts[name]
+                continue
+            png = io.BytesIO()
+            plot.render((draw, dict(kwargs, filename=png)))
+            charts[name] = key, png.getvalue()
+        self.charts = charts
+        return {name: png for name, (key, png) in charts.items()}
+
+    def incremental(self, head):
+        """Whether the results can be updated to `head`, rather than rebuilt"""
+        if self.snapshot is None or self.args.store is not None:
+            # The store is incremental by itself
+            return False
+        try:
+            iomanager.git(
+                ["merge-base", "--is-ancestor", self.snapshot.head, head],
+                self.repo_path,
+            )
+        except subprocess.CalledProcessError:
+            iomanager.warn(
+                f"'{self.args.branch}' was rewritten, starting over", always=True
+            )
+            return False
+        return True
+
+    def refresh(self):
+        """
+        Analyze the commits added to the branch since the last refresh.
+        Returns whether the results changed.
+        """
+        with self.lock:
+            head = iomanager.git_backend().resolve(self.repo_path, self.args.branch)
+            if head is None:
+                iomanager.warn(
+                    f"'{self.args.branch}' not found, not refreshing", always=True
+                )
+                return False
+            if self.snapshot is not None and self.snapshot.head == head:
+                return False
+            previous = self.snapshot.json_obj if self.incremental(head) else None
+            args, results = self.analyze(previous)
+            self.snapshot = Snapshot(
+                head, json_parser.serialize(results), self.render(args, results)
+            )
+            return True
+
+    def poll(self, interval, stop):
+        """Refresh now, then every `interval` seconds until `stop` is set"""
+        while True:
+            try:
+                self.refresh()
+            except (Exception, SystemExit) as e:
+                # Keep polling, the error may be transient
+                iomanager.warn(f"refresh failed: {e}", always=True)
+            if stop.wait(interval):
+                return
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "ctracker"
+
+    def do_GET(self):
+        snapshot = self.server.service.snapshot
+        path = urllib.parse.urlsplit(self.path).path
+        if snapshot is None:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, "No results yet")
+        elif path == "/results.json":
+            self.send_body(snapshot.body, "application/json", snapshot.etag)
+        elif path == "/status":
+            status = {
+                "branch": self.server.service.args.branch,
+                "head": snapshot.head,
+                "updated": snapshot.updated,
+            }
+            self.send_body(json.dumps(status).encode(), "application/json")
+        elif path == "/plots/":
+            names = json.dumps(sorted(snapshot.plots)).encode()
+            self.send_body(names, "application/json", etag(names))
+        elif path.startswith("/plots/") and path[len("/plots/") :] in snapshot.plots:
+            png, png_etag = snapshot.plots[path[len("/plots/") :]]
+            self.send_body(png, "image/png", png_etag)
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND)
+
+    def send_body(self, body, content_type, body_etag=None):
+        if body_etag is not None and body_etag in self.headers.get("If-None-Match", ""):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", body_etag)
+            self.end_headers()
+            return
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if body_etag is not None:
+            self.send_header("ETag", body_etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if context.current().verbose:
+            super().log_message(format, *args)
+
+
+def make_server(service, host, port):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="ctracker serve",
+        description="Serve the results of a repo over HTTP, and keep them up "
+        + "to date with its branch. Other options are those of ctracker, "
+        + "except --format, --update, --from-json and --manifest.",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on. Default to 127.0.0.1",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000, help="Port to listen on. Default to 8000"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=60,
+        help="How often to check the branch for new commits, in seconds. "
+        + "Default to 60",
+    )
+    parser.add_argument(
+        "--no-plots", action="store_true", help="Do not render and serve plots."
+    )
+    serve_args, argv = parser.parse_known_args(argv)
+    if any(arg.split("=")[0] in EXCLUDED_OPTIONS for arg in argv):
+        sys.exit(
+            "ctracker serve: --format, --update, --from-json, --manifest and "
+            + "--sample cannot be used"
+        )
+    args = iomanager.parse_args(argv)
+    if len(args.branches) > 1:
+        sys.exit("ctracker serve: only one --branch can be served")
+    return serve_args, args
+
+
+def start(service, serve_args):
+    """
+    Open the server of `service`, and start polling its branch. Requests are
+    answered with 503 until the first analysis is done. Returns the server,
+    and the event stopping the poller.
+    """
+    server = make_server(service, serve_args.host, serve_args.port)
+    stop = threading.Event()
+    poller = threading.Thread(
+        target=context.bind(service.poll), args=(serve_args.interval, stop), daemon=True
+    )
+    poller.start()
+    return server, stop
+
+
+def main(argv):
+    serve_args, args = parse_args(argv)
+    service = Service(args, context.current().repo_path, not serve_args.no_plots)
+    server, stop = start(service, serve_args)
+    host, port = server.server_address[:2]
+    print(f"serving '{args.repo}' on http://{host}:{port}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
@@ -0,0 +1,277 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+An SQLite store of the facts each metric is made of, per commit: author
+email, author and commit dates, orgs in review and report trailers,
+and orgs owning the changed files. Once the history of a branch is stored,
+metrics are rebuilt from it for any period, window or subset of orgs without
+running git again, and only the commits added since are scanned on later
+runs.
+
+Facts are stored for every org of the config, and author emails are only
+resolved to orgs when querying, as that depends on the selected orgs. The
+store is rebuilt if the config changes, or if the stored head is no longer
+in the branch.
+"""
+
+import datetime
+import hashlib
+import json
+import sqlite3
+import subprocess
+import numpy as np
+from types import SimpleNamespace
+
+from . import context, iomanager, metrics, profiler
+
+STORE_VERSION = 2
+
+# Like metrics.SCAN_LOG_OPTS, with the commit date
+STORE_LOG_OPTS = metrics.SCAN_LOG_OPTS[:-2] + [
+    f"--format=%x02%H{metrics.SEP}%ae{metrics.SEP}%ad{metrics.SEP}%ct%n%B%x03",
+    "--date=format:%s",
+]
+
+TRAILER_KINDS = {
+    "review": metrics.REVIEW_TRAILERS,
+    "report": metrics.REPORT_TRAILERS,
+}
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE commits (
+    id INTEGER PRIMARY KEY,
+    sha TEXT UNIQUE,
+    author_ts INTEGER,
+    commit_ts INTEGER,
+    email TEXT
+);
+CREATE TABLE trailers (commit_id INTEGER, kind TEXT, org TEXT);
+CREATE TABLE owners (commit_id INTEGER, org TEXT);
+CREATE INDEX commits_commit_ts ON commits (commit_ts);
+CREATE INDEX trailers_commit ON trailers (commit_id);
+CREATE INDEX owners_commit ON owners (commit_id);
+"""
+
+
+def config_key():
+    """Changes whenever the stored facts would"""
+    ctx = context.current()
+    config = {
+        "version": STORE_VERSION,
+        "org_files": ctx.org_file_globs,
+        "org_domains": ctx.org_domains,
+        "identities": ctx.identity_index.key,
+        "trailers": TRAILER_KINDS,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+class EventStore:
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+
+    def close(self):
+        self.db.close()
+
+    def meta(self, key):
+        try:
+            row = self.db.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return None  # Empty store
+        return None if row is None else row[0]
+
+    def set_meta(self, **values):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)", list(values.items())
+        )
+
+    def reset(self):
+        for (table,) in self.db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        ).fetchall():
+            self.db.execute(f"DROP TABLE {table}")
+        self.db.executescript(SCHEMA)
+        self.set_meta(config=config_key())
+
+    def sync(self, head):
+        """
+        Store the commits of `head` that are not stored yet. Returns how many
+        were added.
+        """
+        last = self.meta("head")
+        if self.meta("config") != config_key():
+            last = None
+        elif last is not None:
+            try:
+                iomanager.git(f"merge-base --is-ancestor {last} {head}")
+            except subprocess.CalledProcessError:
+                last = None
+        if last == head:
+            return 0
+        if last is None:
+            self.reset()
+        revs = head if last is None else f"{last}..{head}"
+        added = self.add_commits(revs)
+        self.set_meta(head=head)
+        self.db.commit()
+        return added
+
+    def add_commits(self, revs):
+        ctx = context.current()
+        orgs = list(ctx.org_file_globs)
+        args = SimpleNamespace(orgs=orgs)
+        path_cache = ctx.path_index.cache_file(iomanager.cache_dir(), ctx.repo_path)
+        ctx.path_index.load(path_cache)
+        log = iomanager.git_stream(STORE_LOG_OPTS + [revs])
+        total = int(iomanager.git(["rev-list", "--count", "--no-merges", revs])[0])
+        added = 0
+        bar = iomanager.bar("Storing commits", total)
+        for commit in bar.iter(metrics.parse_scan(args, log)):
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO commits (sha, author_ts, commit_ts, email) "
+                + "VALUES (?, ?, ?, ?)",
+                (
+                    commit.sha,
+                    int(commit.timestamp),
+                    int(commit.committed),
+                    commit.email,
+                ),
+            )
+            if cursor.rowcount == 0:
+                continue
+            commit_id = cursor.lastrowid
+            added += 1
+            self.db.executemany(
+                "INSERT INTO trailers VALUES (?, ?, ?)",
+                [
+                    (commit_id, kind, org)
+                    for kind, trailers in TRAILER_KINDS.items()
+                    for org in orgs
+                    if commit.has_trailer(trailers, org)
+                ],
+            )
+            self.db.executemany(
+                "INSERT INTO owners VALUES (?, ?)",
+                [(commit_id, org) for org in ctx.path_index.classify(commit.paths)],
+            )
+        try:
+            ctx.path_index.save(path_cache)
+        except OSError as e:
+            iomanager.warn(f"could not save the org files cache '{path_cache}': {e}")
+        return added
+
+    def query(self, args, sql, params=()):
+        """
+        Run a query over the commits of the --since window, with `bin` set
+        to the bin of their author date, like results.bin_nums() does.
+        """
+        period_secs = args.period * 24 * 60 * 60
+        window = f"""
+            SELECT *, MAX(0, MIN(:last_bin, (author_ts - :initial) / :period)) AS bin
+            FROM commits WHERE commit_ts >= :since
+        """
+        params = dict(
+            params,
+            last_bin=args.bins - 1,
+            initial=args.initial_timestamp,
+            period=period_secs,
+            since=since_timestamp(args),
+        )
+        return self.db.execute(sql.replace("{window}", window), params).fetchall()
+
+
+def since_timestamp(args):
+    """The timestamp `git log --since=<years>.years.ago` would use now"""
+    now = datetime.datetime.now()
+    try:
+        since = now.replace(year=now.year - args.timeframe_years)
+    except ValueError:  # February 29th, which git moves to March 1st
+        since = now.replace(year=now.year - args.timeframe_years, month=3, day=1)
+    return int(since.timestamp())
+
+
+def org_columns(args):
+    return {org: i for i, org in enumerate(args.orgs)}
+
+
+def total_patches(args, store):
+    counts = np.zeros((args.bins, len(args.orgs)), dtype=np.int64)
+    columns = org_columns(args)
+    rows = store.query(
+        args, "SELECT email, bin, COUNT(*) FROM ({window}) GROUP BY email, bin"
+    )
+    for email, bin, n in rows:
+        org = iomanager.org_from_email(email)
+        if org in columns:
+            counts[bin, columns[org]] += n
+    return counts
+
+
+def patches_to_org_files(args, store, internal):
+    counts = np.zeros((args.bins, len(args.orgs)), dtype=np.int64)
+    columns = org_columns(args)
+    rows = store.query(
+        args,
+        "SELECT w.email, w.bin, o.org, COUNT(*) FROM ({window}) AS w "
+        + "JOIN owners AS o ON o.commit_id = w.id GROUP BY w.email, w.bin, o.org",
+    )
+    for email, bin, owner, n in rows:
+        if owner not in columns:
+            continue
+        is_member = iomanager.org_from_email(email) == owner
+        if is_member == internal:
+            counts[bin, columns[owner]] += n
+    return counts
+
+
+def trailer_patches(args, store, kind):
+    counts = np.zeros((args.bins, len(args.orgs)), dtype=np.int64)
+    columns = org_columns(args)
+    rows = store.query(
+        args,
+        "SELECT w.bin, t.org, COUNT(*) FROM ({window}) AS w "
+        + "JOIN trailers AS t ON t.commit_id = w.id "
+        + "WHERE t.kind = :kind GROUP BY w.bin, t.org",
+        {"kind": kind},
+    )
+    for bin, org, n in rows:
+        if org in columns:
+            counts[bin, columns[org]] += n
+    return counts
+
+
+store_registry = {
+    "total_patches": total_patches,
+    "internal_patches_to_org_files": lambda args, store: patches_to_org_files(
+        args, store, True
+    ),
+    "external_patches_to_org_files": lambda args, store: patches_to_org_files(
+        args, store, False
+    ),
+    "reviewed_patches": lambda args, store: trailer_patches(args, store, "review"),
+    "reported_by_patches": lambda args, store: trailer_patches(args, store, "report"),
+}
+
+
+def gather_stats(args):
+    """Like metrics.gather_stats(), from the store at args.store"""
+    store = EventStore(args.store)
+    try:
+        print("======= STORE: syncing with the branch")
+        with profiler.stage("store:sync"):
+            added = store.sync(context.current().branch)
+        print(f"\n{added} new commits stored")
+        results = []
+        for metric in args.metrics:
+            with profiler.stage(f"store:{metric}"):
+                results.append(store_registry[metric](args, store))
+    finally:
+        store.close()
+    return np.stack(results, axis=1), list(args.metrics)
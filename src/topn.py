@@ -0,0 +1,293 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+"""
+The top contributors of each org: its authors and reviewers with the most
+patches, in each time group. Exact per-address counts would take memory in
+proportion to the number of contributors of each group, so every ranking is
+kept by a Space-Saving summary with a bounded number of counters instead.
+"""
+
+import bisect
+import functools
+import heapq
+import re
+
+from . import context, iomanager, metrics, profiler
+from .results import KINDS, bin_edges
+
+REVIEW_KEYWORDS = re.compile(f"({metrics.REVIEW_TRAILERS}):", re.IGNORECASE)
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+
+
+class SpaceSaving:
+    """
+    Approximate counts of the most frequent keys of a stream, within
+    `capacity` counters (Metwally et al., "Efficient Computation of Frequent
+    and Top-k Elements in Data Streams"). Once all counters are taken, a new
+    key replaces the one with the smallest count and starts from it: that
+    count is its `error`, the true count being between count - error and
+    count. Errors are at most total / capacity, so any key seen more often
+    than that is kept.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        # (count, key) of every update, the outdated ones being skipped when
+        # looking for the smallest count
+        self.heap = []
+
+    def add(self, key):
+        self.total += 1
+        if key in self.counts:
+            self.counts[key] += 1
+        else:
+            error = self.evict() if len(self.counts) >= self.capacity else 0
+            self.counts[key] = error + 1
+            self.errors[key] = error
+        heapq.heappush(self.heap, (self.counts[key], key))
+        if len(self.heap) > 4 * self.capacity:
+            self.heapify()
+
+    def evict(self):
+        """Drop the key with the smallest count, and return that count"""
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count:
+                del self.counts[key]
+                del self.errors[key]
+                return count
+
+    def top(self, n):
+        """The n keys with the highest counts, as json objects"""
+        ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return [
+            {"email": key, "count": count, "error": self.errors[key]}
+            for key, count in ranked[:n]
+        ]
+
+    def minimum(self):
+        """What a key not counted may have been seen, at most"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other):
+        """
+        A summary of both streams (Agarwal et al., "Mergeable Summaries"): a
+        key missing from a full summary may have been seen as often as its
+        smallest count, which is added to its count and error. The keys with
+        the highest counts are kept.
+        """
+        floors = self.minimum(), other.minimum()
+        merged = SpaceSaving(self.capacity)
+        merged.total = self.total + other.total
+        for key in set(self.counts) | set(other.counts):
+            merged.counts[key] = self.counts.get(key, floors[0]) + other.counts.get(
+                key, floors[1]
+            )
+            merged.errors[key] = self.errors.get(key, floors[0]) + other.errors.get(
+                key, floors[1]
+            )
+        for key, _ in sorted(
+            merged.counts.items(), key=lambda item: (-item[1], item[0])
+        )[self.capacity :]:
+            del merged.counts[key]
+            del merged.errors[key]
+        merged.heapify()
+        return merged
+
+    def heapify(self):
+        self.heap = [(count, key) for key, count in self.counts.items()]
+        heapq.heapify(self.heap)
+
+    def state(self):
+        """All the counters, as a json object from_state() reads back"""
+        return {
+            "total": self.total,
+            "counters": [
+                [key, count, self.errors[key]] for key, count in self.counts.items()
+            ],
+        }
+
+    @classmethod
+    def from_state(cls, capacity, state):
+        summary = cls(capacity)
+        summary.total = state["total"]
+        for key, count, error in state["counters"]:
+            summary.counts[key] = count
+            summary.errors[key] = error
+        summary.heapify()
+        return summary
+
+
+def reviewers(commit):
+    """The addresses in the review trailers of a commit, once each"""
+    found = {}
+    for line in commit.message:
+        keyword = REVIEW_KEYWORDS.search(line)
+        if keyword is None:
+            continue
+        for email in EMAIL.finditer(line, keyword.end()):
+            found[email.group(0).lower()] = True
+    return list(found)
+
+
+class Rankings:
+    """
+    The Space-Saving summaries of each kind, raw bin and org. Like raw counts,
+    they are kept by bin rather than by time group, see results.fold(), so
+    that --update can go on feeding them the commits added since, and the
+    bins past the last group are merged into it when ranking.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.orgs = set(args.orgs)
+        self.edges = bin_edges(args).tolist()
+        self.summaries = {kind: {} for kind in KINDS}
+        if resumable(args):
+            for kind in KINDS:
+                for bin_id, by_org in enumerate(
+                    args.previous["top"]["summaries"][kind]
+                ):
+                    for org, state in by_org.items():
+                        self.summaries[kind][(bin_id, org)] = SpaceSaving.from_state(
+                            args.top_capacity, state
+                        )
+
+    def add(self, kind, org, bin_id, email):
+        if org in self.orgs:
+            key = (bin_id, org)
+            if key not in self.summaries[kind]:
+                self.summaries[kind][key] = SpaceSaving(self.args.top_capacity)
+            self.summaries[kind][key].add(email)
+
+    def add_commit(self, commit):
+        bin_id = bisect.bisect_right(self.edges, int(commit.timestamp))
+        self.add("authors", commit.org, bin_id, commit.email.lower())
+        for email in reviewers(commit):
+            self.add("reviewers", iomanager.org_from_email(email), bin_id, email)
+
+    def merge(self, summaries):
+        """Add the `summaries` of other Rankings, of the same bins"""
+        for kind in KINDS:
+            for key, summary in summaries[kind].items():
+                if key in self.summaries[kind]:
+                    summary = self.summaries[kind][key].merge(summary)
+                self.summaries[kind][key] = summary
+
+    def group(self, kind, group, org):
+        """The summary of a time group, None if empty"""
+        if group < self.args.groups - 1:
+            bin_ids = [group]
+        else:
+            bin_ids = range(group, self.args.bins)
+        found = [
+            self.summaries[kind][(bin_id, org)]
+            for bin_id in bin_ids
+            if (bin_id, org) in self.summaries[kind]
+        ]
+        return functools.reduce(SpaceSaving.merge, found) if found else None
+
+    def result(self):
+        args = self.args
+        top = {"n": args.top, "capacity": args.top_capacity}
+        for kind in KINDS:
+            top[kind] = []
+            for group in range(args.groups):
+                summaries = {org: self.group(kind, group, org) for org in args.orgs}
+                top[kind].append(
+                    {
+                        org: summary.top(args.top)
+                        for org, summary in summaries.items()
+                        if summary is not None
+                    }
+                )
+        top["summaries"] = {
+            kind: [
+                {
+                    org: self.summaries[kind][(bin_id, org)].state()
+                    for org in args.orgs
+                    if (bin_id, org) in self.summaries[kind]
+                }
+                for bin_id in range(args.bins)
+            ]
+            for kind in KINDS
+        }
+        return top
+
+
+def resumable(args):
+    """Whether the rankings of the results to be updated can be fed on"""
+    if args.previous is None:
+        return False
+    top = args.previous.get("top", {})
+    return "summaries" in top and top["capacity"] == args.top_capacity
+
+
+def gather(args):
+    """
+    The top section of the results, or None without --top. Each kind maps
+    every time group to the top args.top contributors of each org, and the
+    summaries of each bin are kept for --update.
+    """
+    if args.top is None:
+        return None
+    return rank(args).result()
+
+
+def rank(args):
+    """
+    The Rankings of the commits of the analysis. The scan engine and shards
+    fill them in their own walks, see metrics.scan() and
+    metrics.gather_sharded(). Otherwise, the commits are walked here: only
+    those added since the results to be updated if their summaries were kept,
+    the whole --since window of the head if not.
+    """
+    rankings = args.__dict__.pop("rankings", None)
+    if rankings is not None:
+        return rankings
+    with profiler.stage("top"):
+        rankings = Rankings(args)
+        since = args.since.split()
+        if args.previous is None or resumable(args):
+            rev = context.current().branch
+        else:
+            rev = args.head
+        log = iomanager.git_stream(metrics.SCAN_LOG_OPTS + [rev] + since)
+        total = int(
+            iomanager.git(["rev-list", "--count", "--no-merges", rev] + since)[0]
+        )
+        bar = iomanager.bar("Ranking contributors", total)
+        for commit in bar.iter(metrics.parse_scan(args, log)):
+            rankings.add_commit(commit)
+        print()
+    return rankings
+
+
+def print_top(results, time_id):
+    """The top contributors of a time group, as cli tables"""
+    from tabulate import tabulate
+
+    timestamp = results.timestamps[time_id]
+    for kind in KINDS:
+        rows = [
+            [org, entry["email"], entry["count"], entry["error"]]
+            for org, entries in results.top[kind].get(timestamp, {}).items()
+            for entry in entries
+        ]
+        if rows:
+            print(f"--------- TOP {results.top['n']} {kind.upper()}")
+            print(
+                tabulate(
+                    rows,
+                    headers=["org", "email", "patches", "error"],
+                    tablefmt="simple",
+                )
+            )
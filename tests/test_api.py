@@ -0,0 +1,104 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import context, iomanager, json_parser
+from src.api import analyze
+from test_extract import CONFIG_DATA, commit, mkrepo, run, write_config
+from test_extract import cache_home, git_backend
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+OPTIONS = dict(period=0, since=10)
+
+
+def data(results):
+    return json_parser.serialize(results)["data"]
+
+
+@pytest.fixture
+def repos(tmp_path):
+    mkrepo(tmp_path / "repo")
+    mkrepo(tmp_path / "other")
+    other = str(tmp_path / "other")
+    iomanager.git(["checkout", "-q", "-b", "topic"], other)
+    commit(other, "carol@ghi.com", "dir/file5", message="Acked-by: john@xyz.com")
+    commit(other, "dave@xyz.com", "foo/file6")
+    return str(tmp_path / "repo"), other
+
+
+def test_analyze(tmp_path, repos):
+    repo, other = repos
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+    assert (
+        data(analyze(repo, "HEAD", CONFIG_DATA, **OPTIONS)) == run(repo, config)["data"]
+    )
+
+    with pytest.raises(ValueError, match="unknown org"):
+        analyze(repo, "HEAD", CONFIG_DATA, orgs=["nope"], **OPTIONS)
+    with pytest.raises(TypeError):
+        analyze(repo, "HEAD", CONFIG_DATA, format="json")
+
+
+def test_concurrent(repos):
+    repo, other = repos
+    jobs = [
+        (repo, "HEAD", dict(OPTIONS)),
+        (other, "topic", dict(OPTIONS)),
+        (other, "master", dict(OPTIONS, jobs=2)),
+        (other, "topic", dict(OPTIONS, engine="scan", orgs=["org2"])),
+        (repo, "HEAD", dict(OPTIONS, since=2, period=365, top=1)),
+    ]
+    expected = [
+        data(analyze(path, branch, CONFIG_DATA, **o)) for path, branch, o in jobs
+    ]
+    assert expected[1] != expected[2]
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        for _ in range(3):
+            futures = [
+                pool.submit(analyze, path, branch, CONFIG_DATA, **o)
+                for path, branch, o in jobs
+            ]
+            assert [data(f.result()) for f in futures] == expected
+
+
+def test_shared_context(repos):
+    repo, other = repos
+    ctx = context.Context()
+    topic = data(analyze(other, "topic", CONFIG_DATA, context=ctx, **OPTIONS))
+    assert len(ctx.memo) > 0
+    # Not the results of the other branch, nor of other orgs
+    master = data(analyze(other, "master", CONFIG_DATA, context=ctx, **OPTIONS))
+    assert master == data(analyze(other, "master", CONFIG_DATA, **OPTIONS))
+    assert master != topic
+    org2 = analyze(other, "topic", CONFIG_DATA, context=ctx, orgs=["org2"], **OPTIONS)
+    assert data(org2) == data(
+        analyze(other, "topic", CONFIG_DATA, orgs=["org2"], **OPTIONS)
+    )
+    ctx.close()
+
+
+def test_memo():
+    memo = context.Memo(2)
+    memo.get("a", lambda: context.completed(1))
+    memo.get("b", lambda: context.completed(2))
+    assert memo.get("a", None).result() == 1  # Now the most recently used
+    memo.get("c", lambda: context.completed(3))
+    assert list(memo.futures) == ["a", "c"]
+
+
+def test_trailer_matchers(repos):
+    repo, other = repos
+    ctx = context.Context()
+    analyze(other, "topic", CONFIG_DATA, context=ctx, engine="scan", **OPTIONS)
+    matchers = dict(ctx.trailer_matchers)
+    assert len(matchers) > 0
+    # Dropped with the identities, rather than kept for every analysis
+    analyze(repo, "HEAD", CONFIG_DATA, context=ctx, engine="scan", **OPTIONS)
+    assert len(ctx.trailer_matchers) == len(matchers)
+    assert "trailer_matchers" not in ctx.__getstate__()
+    ctx.close()
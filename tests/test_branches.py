@@ -0,0 +1,75 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import branches, iomanager, json_parser, metrics
+from test_extract import commit, mkrepo, run, write_config
+from test_extract import cache_home, git_backend
+from types import SimpleNamespace
+import pytest
+
+BRANCHES = ["master", "stable/1", "topic"]
+
+
+def test_branch_masks():
+    # a <- b <- c (head 0), b <- d (head 1), and e merging c and d (head 2)
+    parents = {"e": "c d", "c": "b", "d": "b", "b": "a", "a": ""}
+    commits = [
+        SimpleNamespace(sha=sha, parents=parents[sha].split()) for sha in "ecdba"
+    ]
+    masks = {c.sha: mask for c, mask in metrics.branch_masks(["c", "d", "e"], commits)}
+    assert masks == {"e": 4, "c": 5, "d": 6, "b": 7, "a": 7}
+
+
+def test_branches(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    mkrepo(repo)
+    repo = str(repo)
+    iomanager.git(["checkout", "-q", "-b", "stable/1", "HEAD~2"], repo)
+    commit(repo, "carol@ghi.com", "dir/file5", message="Acked-by: john@xyz.com")
+    iomanager.git(["checkout", "-q", "-b", "topic", "master"], repo)
+    commit(repo, "dave@xyz.com", "foo/file6", message="Reviewed-by: bob@ghi.com")
+    iomanager.git(
+        ["-c", "user.name=user", "-c", "user.email=user@xyz.com"]
+        + ["merge", "-q", "--no-edit", "stable/1"],
+        repo,
+    )
+    commit(repo, "john@xyz.com", "foo/bar/file7")
+    iomanager.git(["checkout", "-q", "master"], repo)
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+
+    expected = [
+        run(repo, config, ["--engine", "scan", "--branch", branch])
+        for branch in BRANCHES
+    ]
+    assert len({str(e["data"]) for e in expected}) == 3
+
+    logs = []
+    git_stream = iomanager.git_stream
+    monkeypatch.setattr(
+        iomanager, "git_stream", lambda cmd, *a: logs.append(cmd) or git_stream(cmd, *a)
+    )
+    args = iomanager.parse_args(
+        ["--repo", repo, "--config", config, "--period", "0", "--since", "10"]
+        + ["--format", "json", "--branch"]
+        + BRANCHES
+    )
+    assert args.engine == "scan"
+    analyzed = branches.analyze(args)
+    assert len(logs) == 1
+    assert [r.repo for r in analyzed] == ["repo@master", "repo@stable_1", "repo@topic"]
+    for results, branch, e in zip(analyzed, BRANCHES, expected):
+        results = json_parser.serialize(results)
+        assert results["data"] == e["data"]
+        assert results["scan"]["branch"] == branch
+        assert results["scan"]["head"] == e["scan"]["head"]
+        assert results["scan"]["raw"] == e["scan"]["raw"]
+
+
+@pytest.mark.parametrize("options", [["--top", "3"], ["--sample", "0.5"]])
+def test_branches_errors(tmp_path, options):
+    with pytest.raises(SystemExit):
+        iomanager.parse_args(["--repo", str(tmp_path), "--branch", "a", "b"] + options)
@@ -4,11 +4,14 @@
 #
 
 import testframework
-from src import json_parser, iomanager, metrics
+from src import batch, context, gitbackend, json_parser, iomanager, metrics
+import pytest
 import random
 import os
 import yaml
 import datetime
+import subprocess
+import json
 
 CONFIG_DATA = dict(
     org_files=dict(
@@ -48,16 +51,30 @@ EXPECTED_JSON = {
 }
 
 
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture(autouse=True, params=list(gitbackend.BACKENDS))
+def git_backend(request, monkeypatch):
+    monkeypatch.setattr(gitbackend, "DEFAULT_BACKEND", request.param)
+    iomanager.use_git_backend(request.param)
+    yield request.param
+    iomanager.use_git_backend(request.param)
+
+
 def commit(repo, email, path, message=None):
     path = f"{repo}/{path}"
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "wb") as f:
         f.write(random.randbytes(5))
-    iomanager.git(f"add {path}", repo)
+    iomanager.git(["add", path], repo)
     if message is None:
         message = f"add '{path}'"
     iomanager.git(
-        f"-c user.name=user -c user.email={email} commit -m '{message}'", repo
+        ["-c", "user.name=user", "-c", f"user.email={email}", "commit", "-m", message],
+        repo,
     )
 
 
@@ -77,7 +94,7 @@ def write_config(path):
         yaml.dump(CONFIG_DATA, f, default_flow_style=False)
 
 
-def run(repo, config):
+def run(repo, config, extra_args=[]):
     args = iomanager.parse_args(
         [
             "--repo",
@@ -91,12 +108,33 @@ def run(repo, config):
             "--since",
             "10",
         ]
+        + extra_args
     )
     results, headers = metrics.gather_stats(args)
     return json_parser.generate(args, results, headers)
 
 
-def test_extract(tmp_path):
+@pytest.mark.parametrize(
+    "options", [["--engine", "query"], ["--engine", "scan"], ["--jobs", "4"]]
+)
+def test_extract(tmp_path, options):
+    # Paths need no quoting
+    repo = tmp_path / "the user's repo"
+    mkrepo(repo)
+    repo_path = str(repo)
+
+    config_path = str(tmp_path / "config.yaml")
+    write_config(config_path)
+
+    results = run(repo_path, config_path, options)
+    scan = results.pop("scan")
+    assert results == dict(EXPECTED_JSON, repo="the user's repo")
+    assert scan["head"] == iomanager.git("rev-parse HEAD", repo_path)[0]
+    assert scan["raw"]["total_patches"] == [[0, 0], [3, 1]]
+
+
+@pytest.mark.parametrize("engine", ["query", "scan"])
+def test_update(tmp_path, engine):
     repo = tmp_path / "repo"
     mkrepo(repo)
     repo_path = str(repo)
@@ -104,5 +142,129 @@ def test_extract(tmp_path):
     config_path = str(tmp_path / "config.yaml")
     write_config(config_path)
 
-    results = run(repo_path, config_path)
-    assert results == EXPECTED_JSON
+    json_path = str(tmp_path / "repo.json")
+    json_parser.write(json_path, run(repo_path, config_path))
+
+    commit(repo_path, "carol@ghi.com", "dir/file5", message="Acked-by: john@xyz.com")
+    commit(repo_path, "dave@abc.com", "foo/file6")
+
+    args = iomanager.parse_args(
+        ["--repo", repo_path, "--config", config_path, "--update", json_path]
+    )
+    args.engine = engine
+    results, headers = metrics.gather_stats(args)
+    assert results[-1, 0].tolist() == [0, 1]  # Only the new commits are scanned
+    updated = json_parser.generate(args, results, headers)
+    expected = run(repo_path, config_path)
+    assert updated["data"] == expected["data"]
+    assert updated["scan"] == expected["scan"]
+
+    update = ["--repo", repo_path, "--config", config_path, "--update", json_path]
+    assert iomanager.parse_args(update + ["--branch", "HEAD"]).branch == "HEAD"
+    with pytest.raises(SystemExit, match="is of branch 'HEAD'"):
+        iomanager.parse_args(update + ["--branch", "topic"])
+
+
+@pytest.mark.parametrize("jobs", ["1", "2", "4"])
+def test_manifest(tmp_path, jobs):
+    mkrepo(tmp_path / "repo")
+    mkrepo(tmp_path / "other")
+    config_path = str(tmp_path / "config.yaml")
+    write_config(config_path)
+    manifest = str(tmp_path / "manifest.yaml")
+    with open(manifest, "w") as f:
+        yaml.dump({"repos": ["repo", {"path": "other", "name": "renamed"}]}, f)
+
+    out = tmp_path / "out"
+    args = iomanager.parse_args(
+        ["--config", config_path, "--manifest", manifest, "--jobs", jobs]
+        + ["--format", "json", "--dir", str(out), "--period", "0", "--since", "10"]
+        + ["--shards", "4"]
+    )
+    batch.run(args)
+    # At most --jobs processes: the jobs left to each of the 2 repos
+    assert args.shards == {"1": 1, "2": 1, "4": 2}[jobs]
+
+    expected = run(str(tmp_path / "repo"), config_path)
+    for name in ("repo", "renamed"):
+        results = json_parser.read(str(out / f"{name}.json"))
+        assert results["repo"] == name
+        assert results["data"] == json.loads(json.dumps(expected["data"]))
+    with open(out / "summary.json") as f:
+        summary = json.load(f)
+    assert summary["repos"] == ["repo", "renamed"]
+    assert summary["total"]["total_patches"] == {"org1": 6, "org2": 2}
+    assert summary["by_repo"]["renamed"]["reviewed_patches"] == {"org1": 0, "org2": 1}
+
+
+def dated_commit(repo, email, path, author_date, committer_date):
+    env = dict(
+        os.environ,
+        GIT_AUTHOR_DATE=f"@{author_date} +0000",
+        GIT_COMMITTER_DATE=f"@{committer_date} +0000",
+    )
+    os.makedirs(os.path.dirname(f"{repo}/{path}"), exist_ok=True)
+    with open(f"{repo}/{path}", "w") as f:
+        f.write(str(random.random()))
+    subprocess.run(["git", "-C", repo, "add", path], check=True)
+    subprocess.run(
+        ["git", "-C", repo, "-c", "user.name=user", "-c", f"user.email={email}"]
+        + ["commit", "-q", "-m", f"add {path}"],
+        env=env,
+        check=True,
+    )
+
+
+@pytest.mark.parametrize(
+    "options", [["--engine", "query"], ["--engine", "scan"], ["--store", "store.db"]]
+)
+def test_identities(tmp_path, monkeypatch, options):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(context.current(), "identity_index", None)
+    repo = tmp_path / "repo"
+    mkrepo(repo)
+    repo = str(repo)
+    with open(f"{repo}/.mailmap", "w") as f:
+        f.write("Bob <bob@ghi.com> <bob@corp.example>\n")
+    iomanager.git(["add", ".mailmap"], repo)
+    commit(repo, "john@xyz.com", "file5")
+    commit(repo, "jd@home.net", "dir/file6")
+    commit(repo, "bob@corp.example", "foo/file7")
+    commit(repo, "eve@xyz.com", "file8", message="Reviewed-by: Jay <jd@home.net>")
+    config = str(tmp_path / "config.yaml")
+    with open(config, "w") as f:
+        yaml.dump(dict(CONFIG_DATA, members=dict(org2="jd@home.net")), f)
+
+    data = run(repo, config, options)["data"]
+    assert data["total_patches"][timestamp] == {"org1": 5, "org2": 3}
+    assert data["internal_patches_to_org_files"][timestamp] == {"org1": 2, "org2": 1}
+    assert data["external_patches_to_org_files"][timestamp] == {"org1": 2, "org2": 0}
+    assert data["reviewed_patches"][timestamp] == {"org1": 0, "org2": 2}
+    assert len(os.listdir(tmp_path / "cache" / "ctracker")) > 0
+    assert run(repo, config, options)["data"] == data  # From the cached index
+
+
+@pytest.mark.parametrize("engine", ["query", "scan"])
+def test_shards(tmp_path, engine):
+    repo = str(tmp_path / "repo")
+    iomanager.git(f"init -q {repo}", ".")
+    now = int(datetime.datetime.now().timestamp())
+    year = 365 * 24 * 60 * 60
+    for i in range(40):
+        committed = now - ((39 - i) * year) // 4 - 3600
+        # Some author dates fall before the first bin, or after today
+        authored = committed - 12 * year if i % 7 == 0 else committed
+        authored = now + year if i == 5 else authored
+        email = ["a@xyz.com", "b@ghi.com", "c@abc.org"][i % 3]
+        dated_commit(
+            repo, email, ["foo", "dir", "other"][i % 4 % 3], authored, committed
+        )
+    config_path = str(tmp_path / "config.yaml")
+    write_config(config_path)
+
+    options = ["--engine", engine, "--period", "365", "--since", "8"]
+    single = run(repo, config_path, options)
+    sharded = run(repo, config_path, options + ["--shards", "4"])
+    assert sharded == single
+    raw = single["scan"]["raw"]["total_patches"]
+    assert len(raw) == 9 and 0 < sum(map(sum, raw)) < 27
@@ -0,0 +1,41 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import context, gitbackend, iomanager
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = str(tmp_path / "a 'quoted' repo")
+    iomanager.git(["init", "-q", repo], str(tmp_path))
+    for i in range(3):
+        iomanager.git(
+            ["-c", "user.name=u", "-c", "user.email=u@x.com"]
+            + ["commit", "-q", "--allow-empty", "-m", f"commit {i}"],
+            repo,
+        )
+    return repo
+
+
+@pytest.mark.parametrize("name", list(gitbackend.BACKENDS))
+def test_backend(repo, name):
+    backend = gitbackend.create(name, context.GIT_ENV)
+    try:
+        commits = backend.run(repo, ["rev-list", "HEAD"])
+        assert list(backend.stream(repo, ["rev-list", "HEAD"])) == commits
+        assert backend.resolve(repo, "HEAD") == commits[0]
+        assert backend.resolve(repo, "HEAD~2") == commits[2]
+        assert backend.resolve(repo, "HEAD^{tree}") is None
+        assert backend.resolve(repo, "no-such-branch") is None
+        with ThreadPoolExecutor(4) as pool:
+            resolved = pool.map(
+                lambda i: backend.resolve(repo, f"HEAD~{i % 3}"), range(60)
+            )
+            assert list(resolved) == [commits[i % 3] for i in range(60)]
+    finally:
+        backend.close()
@@ -0,0 +1,96 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src.identity import DomainResolver, IdentityIndex, parse_mailmap
+import re
+import pytest
+
+ORG_FILES = dict(xyz="", ghi="", qualcomm="", mediatek="", intel="", ntel="")
+ORG_DOMAINS = dict(qualcomm="quicinc qualcomm", mediatek="mediatek mtk")
+
+DOMAINS = [
+    "xyz.com",
+    "abc.xyz.com",
+    "xyz.ghi.com",
+    "ghi.xyz",
+    "notxyz.com",
+    "xyz",
+    "quicinc.com",
+    "qti.qualcomm.com",
+    "mtk.com.tw",
+    "intel.com",
+    "linux.intel.com",
+    "mintel.com",
+    "example.com",
+    "",
+]
+
+
+def regex_org_from_domain(orgs, domain):
+    """The resolution DomainResolver replaces"""
+    alternatives = [
+        c if c not in ORG_DOMAINS else ORG_DOMAINS[c].replace(" ", "|") for c in orgs
+    ]
+    found = re.compile(f".*({'|'.join(alternatives)})[.].*").match(domain)
+    if found is not None:
+        org = found.group(1)
+        if org in ORG_FILES:
+            return org
+        for org_id, aliases in ORG_DOMAINS.items():
+            if org in aliases:
+                return org_id
+    return None
+
+
+@pytest.mark.parametrize(
+    "orgs",
+    [
+        list(ORG_FILES),
+        list(reversed(ORG_FILES)),
+        ["xyz", "qualcomm"],
+        ["x.z", "qualcomm"],  # a regex
+    ],
+)
+def test_domain_resolver(orgs):
+    resolver = DomainResolver(orgs, ORG_FILES, ORG_DOMAINS)
+    for domain in DOMAINS:
+        expected = regex_org_from_domain(orgs, domain)
+        assert resolver.resolve(domain) == expected, domain
+        assert resolver.resolve(domain) == expected, domain  # cached
+
+
+MAILMAP = """
+# Comments are ignored
+John <john@xyz.com> <jd@home.net>
+<jd@home.net> <JD@Old.Example> # member alias
+Bob <bob@mtk.com> Bob <bob@example.com>
+Intel <john@intel.com> <john@xyz.com>
+Just A Name <jane@example.com>
+"""
+
+
+def test_identity_index(tmp_path):
+    mailmap = parse_mailmap(MAILMAP)
+    assert mailmap == {
+        "jd@home.net": "john@xyz.com",
+        "jd@old.example": "jd@home.net",
+        "bob@example.com": "bob@mtk.com",
+        "john@xyz.com": "john@intel.com",
+    }
+    resolver = DomainResolver(list(ORG_FILES), ORG_FILES, ORG_DOMAINS)
+    members = {"qualcomm": ["JD@home.net"], "ghi": ["ann@example.com"]}
+    index = IdentityIndex.build(members, mailmap, resolver, "key")
+    assert index.get("jd@home.net") == "qualcomm"  # Members win over the mailmap
+    assert index.get("jd@old.example") == "qualcomm"
+    assert index.get("Bob@Example.com") == "mediatek"
+    assert index.get("john@xyz.com") is None  # Left to its domain
+    assert index.get("ann@example.com") == "ghi"
+    assert index.emails_of("qualcomm") == ["jd@home.net", "jd@old.example"]
+
+    filename = IdentityIndex.cache_file(str(tmp_path), "key")
+    index.save(filename)
+    assert IdentityIndex.load(filename, "key").emails == index.emails
+    assert IdentityIndex.load(filename, "other key") is None
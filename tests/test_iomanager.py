@@ -0,0 +1,27 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager
+import subprocess
+import pytest
+
+
+def test_stream():
+    assert list(iomanager.stream("printf 'a\\nb\\n\\nc'")) == ["a", "b", "", "c"]
+
+
+def test_stream_failure():
+    lines = iomanager.stream("echo partial; exit 3")
+    assert next(lines) == "partial"
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        next(lines)
+    assert e.value.returncode == 3
+
+
+def test_stream_early_close():
+    lines = iomanager.stream("yes")
+    assert next(lines) == "y"
+    lines.close()
@@ -0,0 +1,108 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager, json_parser, merge
+from src.api import analyze
+from src.results import Results
+from test_extract import CONFIG_DATA, commit, mkrepo
+from test_extract import cache_home, git_backend
+import datetime
+import numpy as np
+import pytest
+
+OPTIONS = dict(period=365, since=3)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    mkrepo(tmp_path / "repo")
+    return str(tmp_path / "repo")
+
+
+def test_merge_orgs(tmp_path, repo):
+    full = analyze(repo, config=CONFIG_DATA, top=1, **OPTIONS)
+    parts = [
+        analyze(repo, config=CONFIG_DATA, orgs=[org], top=1, **OPTIONS)
+        for org in ("org2", "org1")
+    ]
+    files = [str(tmp_path / "org2.json"), str(tmp_path / "org1.npz")]
+    json_parser.save(files[0], parts[0])
+    json_parser.save(files[1], parts[1], columnar=True)
+    output = str(tmp_path / "merged.json")
+    merge.main(files + ["-o", output])
+
+    merged = json_parser.read(output)
+    expected = json_parser.serialize(full)
+    assert merged["orgs"] == ["org2", "org1"]
+    for metric in full.metrics:
+        for timestamp in full.timestamps:
+            assert (
+                merged["data"][metric][timestamp] == expected["data"][metric][timestamp]
+            )
+    assert merged["repo"] == "repo"
+    assert merged["scan"]["head"] == expected["scan"]["head"]
+    assert merged["scan"]["raw"]["total_patches"] == [
+        row[::-1] for row in expected["scan"]["raw"]["total_patches"]
+    ]
+    assert merged["top"]["authors"] == expected["top"]["authors"]
+    assert merged["top"]["summaries"] == expected["top"]["summaries"]
+
+    with pytest.raises(ValueError, match="twice"):
+        merge.merge([full, parts[0]])
+
+
+def test_merge_repos(tmp_path, repo):
+    mkrepo(tmp_path / "other")
+    commit(str(tmp_path / "other"), "carol@ghi.com", "dir/file5")
+    a = analyze(repo, config=CONFIG_DATA, **OPTIONS)
+    b = analyze(str(tmp_path / "other"), config=CONFIG_DATA, **OPTIONS)
+    merged = merge.merge([a, b])
+    assert merged.repo == "repo+other"
+    assert merged.orgs == a.orgs and merged.timestamps == a.timestamps
+    assert np.array_equal(merged.counts, a.counts + b.counts)
+    assert merged.scan is None
+
+    with pytest.raises(ValueError, match="periods"):
+        merge.merge([a, analyze(repo, config=CONFIG_DATA, period=30, since=3)])
+
+
+def test_merge_mirrors(tmp_path, repo):
+    mirror = tmp_path / "mirror" / "repo"
+    iomanager.git(["clone", "-q", repo, str(mirror)])
+    commit(str(mirror), "carol@ghi.com", "dir/file5")
+    a = analyze(repo, config=CONFIG_DATA, **OPTIONS)
+    b = analyze(str(mirror), config=CONFIG_DATA, **OPTIONS)
+    assert a.scan["head"] != b.scan["head"]
+    with pytest.raises(ValueError, match="clones"):
+        merge.merge([a, b])
+    # Different repos named alike
+    merged = merge.merge([a, b], allow_overlap=True)
+    assert np.array_equal(merged.counts, a.counts + b.counts)
+
+
+def results(timestamps, counts):
+    counts = np.array(counts, dtype=np.int64).reshape(len(timestamps), 1, 1)
+    return Results("repo", 10, timestamps, ["total_patches"], ["org"], counts, None)
+
+
+def test_merge_time_ranges():
+    merged = merge.merge(
+        [
+            results(["2020-01-21", "2020-01-31"], [1, 2]),
+            results(["2020-01-01"], [4]),
+            results(["2020-01-31"], [8]),
+        ]
+    )
+    assert merged.timestamps == [
+        "2020-01-01",
+        "2020-01-11",
+        "2020-01-21",
+        "2020-01-31",
+    ]
+    assert merged.column("total_patches")[:, 0].tolist() == [4, 0, 1, 10]
+
+    with pytest.raises(ValueError, match="same day"):
+        merge.merge([results(["2020-01-01"], [1]), results(["2020-01-02"], [1])])
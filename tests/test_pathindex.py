@@ -0,0 +1,60 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager
+from src.pathindex import PathIndex
+
+ORG_GLOBS = dict(
+    huawei=["*hisilicon*", "*hi36[67]0*", "*hip0[67]*"],
+    mediatek=["*mtk-*", "*mt[0-9][0-9]*"],
+    mips=["*r1[24]000*", "*[!a-z]mips*"],
+    other=["*a?c*", "*x*y*"],
+)
+
+PATHS = [
+    "drivers/hisilicon/foo.c",
+    "arch/arm64/boot/dts/hisilicon/hi3660.dtsi",
+    "arch/arm64/boot/dts/hisilicon/hi3680.dtsi",
+    "drivers/net/hip07/x.c",
+    "drivers/mtk-foo/a.c",
+    "mt76/mt7615/main.c",
+    "mtx/readme",
+    "cpu/r12000.h",
+    "cpu/r13000.h",
+    "arch/mips/kernel.c",
+    "archmips/kernel.c",
+    "abc/def",
+    "a/c/x/y",
+    "x",
+]
+
+
+def git_owners(repo, globs):
+    pathspecs = " ".join(f"'{g}'" for g in globs)
+    return set(iomanager.git(f"ls-files -- {pathspecs}", repo))
+
+
+def test_path_index(tmp_path):
+    repo = str(tmp_path)
+    iomanager.git("init", repo)
+    for path in PATHS:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("")
+    iomanager.git("add .", repo)
+
+    index = PathIndex(ORG_GLOBS)
+    for org, globs in ORG_GLOBS.items():
+        expected = git_owners(repo, globs)
+        assert {p for p in PATHS if org in index.lookup(p)} == expected, org
+
+    cache = str(tmp_path / "cache" / "paths.json")
+    index.save(cache)
+    loaded = PathIndex(ORG_GLOBS)
+    loaded.load(cache)
+    assert loaded.owners == index.owners
+    changed = PathIndex(dict(ORG_GLOBS, mips=["*mips*"]))
+    changed.load(cache)
+    assert changed.owners == {}
@@ -0,0 +1,49 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager, json_parser, plot
+from types import SimpleNamespace
+import os
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
+
+
+def mkplots(out_dir, jobs, highlight=["qualcomm"]):
+    out_dir.mkdir(exist_ok=True)
+    results = json_parser.load(os.path.join(EXAMPLES, "json", "qemu.json"))
+    args = SimpleNamespace(dir=str(out_dir), jobs=jobs, highlight=highlight)
+    pretty_names = [
+        iomanager.metrics_pretty_names[iomanager.all_metrics.index(m)]
+        for m in results.metrics
+    ]
+    plot.mkplots(args, results, pretty_names)
+    return {
+        f: (out_dir / f).read_bytes()
+        for f in sorted(os.listdir(out_dir))
+        if f.endswith(".png")
+    }
+
+
+def test_parallel_plots_are_stable(tmp_path):
+    serial = mkplots(tmp_path / "serial", 1)
+    assert len(serial) == 7
+    assert mkplots(tmp_path / "parallel", 4) == serial
+
+
+def test_plot_cache(tmp_path, capsys):
+    out_dir = tmp_path / "plots"
+    plots = mkplots(out_dir, 1)
+    assert "plots: 7 rendered, 0 reused" in capsys.readouterr().out
+    assert mkplots(out_dir, 1) == plots
+    assert "plots: 0 rendered, 7 reused" in capsys.readouterr().out
+
+    (out_dir / "review_ratio_qemu.png").unlink()
+    assert mkplots(out_dir, 1) == plots
+    assert "plots: 1 rendered, 6 reused" in capsys.readouterr().out
+
+    # Highlighting an org changes every chart
+    assert mkplots(out_dir, 2, highlight=["intel"]) != plots
+    assert "plots: 7 rendered, 0 reused" in capsys.readouterr().out
@@ -0,0 +1,43 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import context, iomanager, prepare
+from test_extract import commit, mkrepo, write_config, cache_home
+import os
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def git_env(monkeypatch):
+    ctx = context.current()
+    monkeypatch.setattr(ctx, "git_env", dict(ctx.git_env))
+
+
+@pytest.mark.parametrize("alternate", [False, True])
+def test_prepare(tmp_path, alternate):
+    mkrepo(tmp_path / "repo")
+    repo = str(tmp_path / "repo")
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+    repo_objects = os.path.join(repo, ".git", "objects")
+    object_dir = str(tmp_path / "alt") if alternate else repo_objects
+    options = ["--repo", repo] + (["--object-dir", object_dir] if alternate else [])
+    head = iomanager.git("rev-parse HEAD", repo)[0]
+
+    assert prepare.graph_status(object_dir, head) == "missing"
+    prepare.main(options + ["--config", config])
+    assert prepare.graph_status(object_dir, head) == "up to date"
+    if alternate:
+        assert prepare.graph_files(repo_objects) == []
+    with pytest.raises(SystemExit) as e:
+        prepare.main(options + ["--check"])
+    assert e.value.code == 0
+
+    commit(repo, "bob@ghi.com", "dir/file5")
+    head = iomanager.git("rev-parse HEAD", repo)[0]
+    assert prepare.graph_status(object_dir, head) == "stale"
+    prepare.main(options)
+    assert prepare.graph_status(object_dir, head) == "up to date"
@@ -0,0 +1,42 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager, metrics, profiler
+from test_extract import mkrepo, write_config, cache_home
+import json
+import pstats
+import pytest
+
+
+@pytest.mark.parametrize("engine", ["query", "scan"])
+def test_profile(tmp_path, engine):
+    mkrepo(tmp_path / "repo")
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+    report = tmp_path / "profile.json"
+    stats = tmp_path / "profile.out"
+    args = iomanager.parse_args(
+        ["--repo", str(tmp_path / "repo"), "--config", config, "--engine", engine]
+        + ["--profile", str(report), "--cprofile", str(stats)]
+    )
+    try:
+        metrics.gather_stats(args)
+    finally:
+        profiler.finish()
+
+    with open(report) as f:
+        report = json.load(f)
+    stages = {stage["name"]: stage for stage in report["stages"]}
+    if engine == "scan":
+        assert list(stages) == ["scan"]
+        # The 4 commits, plus the count for the progress bar
+        assert stages["scan"]["git_calls"] == 2
+    else:
+        assert list(stages) == [f"metric:{m}" for m in iomanager.all_metrics]
+        assert stages["metric:total_patches"]["git_lines"] == 4 + 1
+    assert report["total"]["git_calls"] >= sum(s["git_calls"] for s in stages.values())
+    assert all(stage["peak_rss_kib"] > 0 for stage in stages.values())
+    assert pstats.Stats(str(stats)).total_calls > 0
@@ -0,0 +1,81 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import convert, json_parser
+from src.results import Tally
+from types import SimpleNamespace
+import numpy as np
+import os
+import pytest
+
+DAY = 24 * 60 * 60
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
+
+
+def test_tally():
+    args = SimpleNamespace(orgs=["a", "b"], bins=3, period=10, initial_timestamp=0)
+    tally = Tally(args)
+    tally.BATCH_SIZE = 2
+    events = [
+        ("a", -1),  # clamped to the first bin
+        ("a", 0),
+        ("b", 10 * DAY - 1),
+        ("b", 10 * DAY),
+        (None, 15 * DAY),
+        ("a", 30 * DAY),
+        ("a", 1000 * DAY),  # clamped to the last bin
+    ]
+    for org, timestamp in events:
+        tally.add(org, str(timestamp))
+    assert tally.result().tolist() == [[2, 1], [0, 1], [2, 0]]
+    assert tally.result(untracked=True)[:, 2].tolist() == [0, 1, 0]
+
+
+def test_json_roundtrip():
+    json_obj = json_parser.read(os.path.join(EXAMPLES, "json", "qemu.json"))
+    results = json_parser.deserialize(json_obj)
+    assert results.counts.shape == (5, 5, 17)
+    assert results.column("total_patches")[0, 0] == 863
+    assert json_parser.serialize(results) == json_obj
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_columnar(tmp_path, compress):
+    json_path = os.path.join(EXAMPLES, "json", "qemu.json")
+    columnar_path = str(tmp_path / "qemu.npz")
+    json_parser.convert(json_path, columnar_path, compress)
+
+    results = json_parser.load(columnar_path)
+    assert results._counts is None
+    assert results.column("total_patches")[0, 0] == 863
+    assert list(results._columns) == ["total_patches"]  # Loaded lazily
+    assert json_parser.read(columnar_path) == json_parser.read(json_path)
+
+    results.close()
+
+    back_path = str(tmp_path / "qemu.json")
+    convert.main([columnar_path, back_path])
+    assert json_parser.read(back_path) == json_parser.read(json_path)
+
+
+def open_files():
+    return len(os.listdir("/proc/self/fd"))
+
+
+def test_columnar_files_are_closed(tmp_path):
+    columnar_path = str(tmp_path / "qemu.npz")
+    json_parser.convert(os.path.join(EXAMPLES, "json", "qemu.json"), columnar_path)
+    before = open_files()
+    with json_parser.load(columnar_path) as results:
+        assert open_files() == before + 1
+        results.column("total_patches")
+    assert open_files() == before
+
+    not_results = str(tmp_path / "other.npz")
+    np.savez(not_results, header=np.frombuffer(b'{"format": "other"}', np.uint8))
+    with pytest.raises(ValueError, match="not a ctracker results file"):
+        json_parser.load(not_results)
+    assert open_files() == before
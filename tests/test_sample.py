@@ -0,0 +1,85 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager, json_parser, merge, metrics
+from src.results import Results, sample_estimates
+from test_extract import commit, mkrepo, run, write_config
+from test_extract import cache_home, git_backend
+import contextlib
+import io
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("rate", [0.05, 0.3, 0.8])
+def test_sample_estimates(rate):
+    rng = np.random.default_rng(0)
+    truth = rng.integers(0, 400, size=2000)
+    estimates, low, high = sample_estimates(rng.binomial(truth, rate), rate)
+    assert np.all((low <= estimates) & (estimates <= high))
+    assert np.mean((low <= truth) & (truth <= high)) > 0.93
+
+    estimates, low, high = sample_estimates([0, 7], 1)
+    assert estimates.tolist() == low.tolist() == high.tolist() == [0, 7]
+
+
+def test_sample(tmp_path):
+    repo = tmp_path / "repo"
+    mkrepo(repo)
+    repo = str(repo)
+    for i in range(40):
+        commit(repo, "john@xyz.com", f"foo/file{i}")
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+
+    full = run(repo, config)
+    exact = run(repo, config, ["--sample", "1"])
+    assert exact["data"] == full["data"]
+    assert "scan" not in exact and exact["sample"]["rate"] == 1
+
+    def sampled(seed):
+        return run(repo, config, ["--sample", "0.5", "--seed", str(seed)])
+
+    results = sampled(1)
+    assert sampled(1) == results
+    assert sampled(2)["data"] != results["data"]
+
+    args = iomanager.parse_args(
+        ["--repo", repo, "--config", config, "--sample", "0.5", "--seed", "1"]
+    )
+    commits = metrics.sample_commits(args)
+    assert 0 < len(commits) < 44
+    timestamp = results["timestamps"][-1]
+    total = results["data"]["total_patches"][timestamp]
+    assert total["org1"] + total["org2"] == pytest.approx(2 * len(commits), abs=1)
+    for metric, by_time in results["data"].items():
+        for org, estimate in by_time[timestamp].items():
+            low = results["sample"]["low"][metric][timestamp][org]
+            high = results["sample"]["high"][metric][timestamp][org]
+            assert low <= estimate <= high
+
+    filename = str(tmp_path / "repo.npz")
+    json_parser.save(filename, json_parser.deserialize(results), columnar=True)
+    loaded = json_parser.load(filename)
+    assert loaded.sample == results["sample"]
+    with pytest.raises(ValueError, match="estimates"):
+        merge.merge([loaded, json_parser.deserialize(full)])
+
+    args.format = "cli"
+    with contextlib.redirect_stdout(io.StringIO()) as f:
+        counts, headers = metrics.gather_stats(args)
+        iomanager.write_results(args, Results.from_args(args, counts, headers))
+    high = results["sample"]["high"]["total_patches"][timestamp]["org1"]
+    assert f"{total['org1']} [" in f.getvalue()
+    assert f", {high}]" in f.getvalue()
+
+
+@pytest.mark.parametrize(
+    "options", [["--sample", "0"], ["--sample", "0.5", "--top", "3"]]
+)
+def test_sample_errors(tmp_path, options):
+    with pytest.raises(SystemExit):
+        iomanager.parse_args(["--repo", str(tmp_path)] + options)
@@ -0,0 +1,151 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager, serve
+from test_extract import commit, mkrepo, run, write_config
+from test_extract import cache_home, git_backend
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+
+
+def get(server, path, etag=None):
+    host, port = server.server_address[:2]
+    request = urllib.request.Request(f"http://{host}:{port}{path}")
+    if etag is not None:
+        request.add_header("If-None-Match", etag)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers.get("ETag"), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("ETag"), b""
+
+
+@pytest.fixture
+def server(tmp_path):
+    repo = tmp_path / "repo"
+    mkrepo(repo)
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+    serve_args, args = serve.parse_args(
+        ["--port", "0", "--repo", str(repo), "--config", config]
+        + ["--period", "0", "--since", "10"]
+    )
+    service = serve.Service(args, str(repo))
+    service.refresh()
+    server = serve.make_server(service, "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_serve(tmp_path, server):
+    repo = str(tmp_path / "repo")
+    config = str(tmp_path / "config.yaml")
+    status, etag, body = get(server, "/results.json")
+    assert status == 200
+    assert json.loads(body)["data"] == run(repo, config)["data"]
+    assert get(server, "/results.json", etag)[:2] == (304, etag)
+
+    status, _, body = get(server, "/plots/")
+    names = json.loads(body)
+    assert "total_patches_repo.png" in names
+    status, _, png = get(server, f"/plots/{names[0]}")
+    assert status == 200 and png.startswith(b"\x89PNG")
+    assert get(server, "/plots/missing.png")[0] == 404
+
+    # Nothing new
+    assert not server.service.refresh()
+    assert get(server, "/results.json", etag)[0] == 304
+
+    commit(repo, "carol@ghi.com", "dir/file5", message="Acked-by: john@xyz.com")
+    assert server.service.refresh()
+    status, new_etag, body = get(server, "/results.json", etag)
+    assert status == 200 and new_etag != etag
+    results = json.loads(body)
+    expected = run(repo, config)
+    assert results["data"] == expected["data"]
+    assert results["scan"]["head"] == expected["scan"]["head"]
+    status, _, body = get(server, "/status")
+    assert json.loads(body)["head"] == expected["scan"]["head"]
+
+    # History rewrites start the analysis over
+    iomanager.git(["reset", "--hard", "HEAD~2"], repo)
+    assert server.service.refresh()
+    assert (
+        json.loads(get(server, "/results.json")[2])["data"] == run(repo, config)["data"]
+    )
+
+
+def test_no_results_yet(tmp_path):
+    server = serve.make_server(serve.Service(None, str(tmp_path)), "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert get(server, "/results.json")[0] == 503
+        assert get(server, "/status")[0] == 503
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_poll_errors(tmp_path, capsys):
+    service = serve.Service(None, str(tmp_path))
+    stop = threading.Event()
+    calls = []
+
+    def refresh():
+        calls.append(None)
+        if len(calls) == 2:
+            stop.set()
+        raise SystemExit("fatal: 'main' is not a valid commit")
+
+    service.refresh = refresh
+    service.poll(0, stop)
+    assert len(calls) == 2  # Still polling after the first failure
+    assert "refresh failed" in capsys.readouterr().err
+
+
+def test_startup(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    mkrepo(repo)
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+    serve_args, args = serve.parse_args(
+        ["--port", "0", "--no-plots", "--repo", str(repo), "--config", config]
+        + ["--period", "0", "--since", "10"]
+    )
+    service = serve.Service(args, str(repo), plots=False)
+    analyzing = threading.Event()
+    analyze = service.analyze
+
+    def slow_analyze(previous):
+        analyzing.wait()
+        return analyze(previous)
+
+    monkeypatch.setattr(service, "analyze", slow_analyze)
+    server, stop = serve.start(service, serve_args)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        # Listening while the first analysis runs
+        assert get(server, "/results.json")[0] == 503
+        analyzing.set()
+        for _ in range(100):
+            if service.snapshot is not None:
+                break
+            stop.wait(0.1)
+        status, _, body = get(server, "/results.json")
+        assert status == 200
+        assert json.loads(body)["data"] == run(str(repo), config)["data"]
+    finally:
+        stop.set()
+        server.shutdown()
+        server.server_close()
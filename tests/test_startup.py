@@ -0,0 +1,47 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Modules that `--from-json ... --format cli` has no use for
+HEAVY_MODULES = ["matplotlib", "progress", "yaml"]
+
+# Far above the expected time, only meant to catch heavy imports creeping back
+TIME_BUDGET = 2.0
+
+# Runs ctracker, then reports which of the heavy modules it loaded
+PROBE = """
+import runpy, sys
+sys.argv = ["ctracker"] + sys.argv[1:]
+try:
+    runpy.run_path("ctracker", run_name="__main__")
+finally:
+    loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+    print("LOADED:" + ",".join(loaded), file=sys.stderr)
+"""
+
+
+def test_from_json_cli_startup():
+    cmd = [
+        sys.executable,
+        "-c",
+        f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{PROBE}",
+        "--from-json",
+        "examples/json/qemu.json",
+        "--format",
+        "cli",
+    ]
+    start = time.monotonic()
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, check=True)
+    elapsed = time.monotonic() - start
+    assert "TIMEFRAME" in proc.stdout
+    assert proc.stderr.strip().splitlines()[-1] == "LOADED:"
+    assert elapsed < TIME_BUDGET
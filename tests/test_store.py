@@ -0,0 +1,44 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager
+from test_extract import commit, dated_commit, mkrepo, run, write_config
+from test_extract import cache_home, git_backend
+import datetime
+import pytest
+
+YEAR = 365 * 24 * 60 * 60
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        [],
+        ["--period", "365", "--since", "3"],
+        ["--orgs", "org2"],
+    ],
+)
+def test_store(tmp_path, capsys, options):
+    repo = tmp_path / "repo"
+    mkrepo(repo)
+    repo = str(repo)
+    now = int(datetime.datetime.now().timestamp())
+    # Older commits, one of them authored before any --since
+    dated_commit(repo, "eve@ghi.com", "dir/old", now - 6 * YEAR, now - 2 * YEAR)
+    dated_commit(repo, "eve@xyz.com", "foo/old", now - YEAR, now - YEAR)
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+    store = ["--store", str(tmp_path / "store.db")]
+
+    # Fill the store with other options than the ones tested
+    run(repo, config, store + ["--period", "30"])
+    assert run(repo, config, store + options) == run(repo, config, options)
+
+    assert "\n0 new commits stored" in capsys.readouterr().out
+
+    commit(repo, "carol@ghi.com", "dir/file5", message="Acked-by: john@xyz.com")
+    assert run(repo, config, store + options) == run(repo, config, options)
+    assert "\n1 new commits stored" in capsys.readouterr().out
@@ -0,0 +1,183 @@
+#
+# Copyright (c) 2024 Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+#
+
+import testframework
+from src import iomanager, json_parser, metrics, topn
+from src.results import Results
+from src.topn import SpaceSaving
+from test_extract import commit, dated_commit, mkrepo, timestamp, write_config
+from test_extract import cache_home, git_backend
+import collections
+import datetime
+import contextlib
+import io
+import random
+import pytest
+
+
+@pytest.mark.parametrize("capacity", [5, 20, 100])
+def test_space_saving(capacity):
+    rng = random.Random(capacity)
+    # A few heavy hitters in a long tail
+    stream = [f"k{int(rng.paretovariate(1.2))}" for _ in range(5000)]
+    exact = collections.Counter(stream)
+    summary = SpaceSaving(capacity)
+    for key in stream:
+        summary.add(key)
+
+    assert len(summary.counts) <= capacity
+    assert sum(summary.counts.values()) == len(stream)
+    for key, count in summary.counts.items():
+        error = summary.errors[key]
+        assert count - error <= exact[key] <= count
+        assert error <= len(stream) / capacity
+    for key, count in exact.items():
+        if count > len(stream) / capacity:
+            assert key in summary.counts
+    if capacity >= len(exact):
+        assert summary.counts == exact
+
+
+def test_merge():
+    rng = random.Random(0)
+    streams = [[f"k{int(rng.paretovariate(1.2))}" for _ in range(2000)] for _ in "ab"]
+    exact = collections.Counter(streams[0] + streams[1])
+    summaries = [SpaceSaving(20), SpaceSaving(20)]
+    for summary, stream in zip(summaries, streams):
+        for key in stream:
+            summary.add(key)
+    merged = summaries[0].merge(summaries[1])
+    assert len(merged.counts) == 20 and merged.total == 4000
+    for key, count in merged.counts.items():
+        assert count - merged.errors[key] <= exact[key] <= count
+    state = SpaceSaving.from_state(20, merged.state())
+    assert state.counts == merged.counts and state.errors == merged.errors
+
+
+def test_top(tmp_path):
+    repo = tmp_path / "repo"
+    mkrepo(repo)
+    repo = str(repo)
+    commit(repo, "John@xyz.com", "file5", message="Acked-by: Bob <bob@ghi.com>")
+    commit(repo, "eve@ghi.com", "file6", message="Tested-by: eve@ghi.com")
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+
+    args = iomanager.parse_args(
+        ["--repo", repo, "--config", config, "--period", "0", "--since", "10"]
+        + ["--top", "1"]
+    )
+    counts, headers = metrics.gather_stats(args)
+    results = Results.from_args(args, counts, headers, topn.gather(args))
+    top = json_parser.serialize(results)["top"]
+    assert top["n"] == 1 and top["capacity"] == 10
+    assert top["authors"] == {
+        timestamp: {
+            "org1": [{"email": "john@xyz.com", "count": 3, "error": 0}],
+            "org2": [{"email": "bob@ghi.com", "count": 1, "error": 0}],
+        }
+    }
+    assert top["reviewers"] == {
+        timestamp: {"org2": [{"email": "bob@ghi.com", "count": 2, "error": 0}]}
+    }
+
+    filename = str(tmp_path / "repo.npz")
+    json_parser.save(filename, results, columnar=True)
+    assert json_parser.load(filename).top == top
+
+    args.format = "cli"
+    with contextlib.redirect_stdout(io.StringIO()) as f:
+        iomanager.write_results(args, results)
+    out = f.getvalue()
+    assert "TOP 1 AUTHORS" in out and "TOP 1 REVIEWERS" in out
+
+
+def run_top(repo, config, options):
+    args = iomanager.parse_args(
+        ["--repo", repo, "--config", config, "--period", "0", "--since", "10"] + options
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        counts, headers = metrics.gather_stats(args)
+        top = topn.gather(args)
+    return json_parser.serialize(Results.from_args(args, counts, headers, top))
+
+
+def sorted_summaries(top):
+    return {
+        kind: [
+            {org: sorted(state["counters"]) for org, state in by_org.items()}
+            for by_org in by_bin
+        ]
+        for kind, by_bin in top["summaries"].items()
+    }
+
+
+@pytest.mark.parametrize("engine", ["query", "scan"])
+def test_top_update(tmp_path, monkeypatch, engine):
+    repo = tmp_path / "repo"
+    mkrepo(repo)
+    repo = str(repo)
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+    options = ["--engine", engine, "--top", "1"]
+    json_path = str(tmp_path / "repo.json")
+    json_parser.write(json_path, run_top(repo, config, options))
+
+    commit(repo, "carol@ghi.com", "dir/file5", message="Acked-by: john@xyz.com")
+    commit(repo, "eve@ghi.com", "file6", message="Tested-by: eve@ghi.com")
+
+    logs = []
+    git_stream = iomanager.git_stream
+    monkeypatch.setattr(
+        iomanager, "git_stream", lambda cmd, *a: logs.append(cmd) or git_stream(cmd, *a)
+    )
+    args = iomanager.parse_args(
+        ["--repo", repo, "--config", config, "--update", json_path]
+        + ["--engine", engine]
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        counts, headers = metrics.gather_stats(args)
+        top = json_parser.serialize(
+            Results.from_args(args, counts, headers, topn.gather(args))
+        )["top"]
+    # Only the new commits are walked, once with the scan engine
+    walks = [cmd for cmd in logs if "log" in cmd]
+    assert walks and all(any(".." in arg for arg in cmd) for cmd in walks)
+    if engine == "scan":
+        assert len(walks) == 1
+
+    monkeypatch.undo()
+    expected = run_top(repo, config, options)["top"]
+    assert top["authors"] == expected["authors"]
+    assert top["reviewers"] == expected["reviewers"]
+    assert sorted_summaries(top) == sorted_summaries(expected)
+
+
+@pytest.mark.parametrize("engine", ["query", "scan"])
+def test_top_shards(tmp_path, monkeypatch, engine):
+    repo = str(tmp_path / "repo")
+    iomanager.git(f"init -q {repo}", ".")
+    now = int(datetime.datetime.now().timestamp())
+    year = 365 * 24 * 60 * 60
+    for i in range(24):
+        committed = now - ((23 - i) * year) // 4 - 3600
+        email = ["a@xyz.com", "b@ghi.com", "c@xyz.com", "d@ghi.com"][i % 4 * i % 3]
+        dated_commit(repo, email, "foo", committed, committed)
+    config = str(tmp_path / "config.yaml")
+    write_config(config)
+    options = ["--engine", engine, "--period", "365", "--since", "6", "--top", "2"]
+    single = run_top(repo, config, options)
+
+    logs = []
+    git_stream = iomanager.git_stream
+    monkeypatch.setattr(
+        iomanager, "git_stream", lambda cmd, *a: logs.append(cmd) or git_stream(cmd, *a)
+    )
+    sharded = run_top(repo, config, options + ["--shards", "3"])
+    assert logs == []  # Ranked by the shards, not walked again
+    assert sharded["top"]["authors"] == single["top"]["authors"]
+    assert sharded["top"]["reviewers"] == single["top"]["reviewers"]
+    assert sorted_summaries(sharded["top"]) == sorted_summaries(single["top"])
+    assert any(single["top"]["authors"].values())